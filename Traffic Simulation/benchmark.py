@@ -0,0 +1,118 @@
+import argparse
+import os
+import random
+import time
+import tracemalloc
+
+# бенчмарк работает без окна
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import numpy as np
+
+from road_traffic import TrafficSimulation
+
+
+# метод движка и то, что вызывается перед каждым замером: удалять есть что,
+# только если машины успели сдвинуться, иначе мерился бы пустой вызов
+ENGINE_METHODS = (
+    ("update_car_physics", None),
+    ("remove_offroad_cars", "update_car_physics"),
+)
+
+
+def build_simulation(num_cars, lanes, seed, ring, fit):
+    random.seed(seed)
+    np.random.seed(seed)
+    # около ста единиц на машину в полосе, как при обычном движении
+    road_length = max(1100, num_cars * 100 // lanes)
+    sim = TrafficSimulation(road_length=road_length, lanes=lanes, initial_cars=num_cars,
+                            ring=ring, threaded=False)
+    if fit:
+        sim.camera.zoom = sim.camera.min_zoom
+    return sim
+
+
+def time_calls(func, repeats, prepare=None):
+    total = 0.0
+    for _ in range(repeats):
+        if prepare:
+            prepare()
+        start = time.perf_counter()
+        func()
+        total += time.perf_counter() - start
+    return total / repeats
+
+
+def peak_memory(func, prepare=None):
+    if prepare:
+        prepare()
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def measure(method, repeats, prepare=None):
+    # пиковую память меряем отдельным вызовом: tracemalloc сильно замедляет код
+    return time_calls(method, repeats, prepare), peak_memory(method, prepare)
+
+
+def run_benchmark(num_cars, args):
+    sim = build_simulation(num_cars, args.lanes, args.seed, args.ring, args.fit)
+    engine = sim.engine
+    for _ in range(args.warmup):
+        engine.step()
+
+    start = time.perf_counter()
+    for _ in range(args.steps):
+        engine.step()
+    steps_per_second = args.steps / (time.perf_counter() - start)
+
+    results = []
+    for name, prepare in ENGINE_METHODS:
+        prepare = getattr(engine, prepare) if prepare else None
+        results.append((name,) + measure(getattr(engine, name), args.repeats, prepare))
+
+    engine.publish(wait=True)
+    sim.snapshot = engine.front
+    sim.update_camera()
+    # без выбранной машины draw_selected_car_info ничего не рисует
+    if engine.road.count:
+        sim.selected_car_id = int(engine.road.ids[engine.road.count // 2])
+    for name in sim.draw_phases + ("draw_profile",):
+        results.append((name,) + measure(getattr(sim, name), args.repeats))
+
+    cars = engine.road.count
+    engine.close()
+    return cars, steps_per_second, results
+
+
+def print_report(num_cars, cars, steps_per_second, results):
+    print(f"\n=== {num_cars} машин (на дороге {cars}): {steps_per_second:.1f} шагов/с ===")
+    print(f"{'метод':<24}{'мс/вызов':>12}{'вызовов/с':>12}{'пик, КиБ':>12}")
+    for name, seconds, peak in results:
+        rate = 1 / seconds if seconds > 0 else float("inf")
+        print(f"{name:<24}{seconds * 1000:>12.3f}{rate:>12.0f}{peak / 1024:>12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк симуляции трафика")
+    parser.add_argument("--counts", default="10,100,1000,10000,100000",
+                        help="число машин через запятую")
+    parser.add_argument("--steps", type=int, default=200, help="шагов для замера скорости")
+    parser.add_argument("--warmup", type=int, default=10, help="шагов прогрева")
+    parser.add_argument("--repeats", type=int, default=20, help="повторов каждого метода")
+    parser.add_argument("--lanes", type=int, default=1, choices=range(1, 7), help="число полос")
+    parser.add_argument("--seed", type=int, default=0, help="зерно генератора")
+    parser.add_argument("--ring", action="store_true", help="кольцевая дорога")
+    parser.add_argument("--fit", action="store_true",
+                        help="показывать всю дорогу, а не начало")
+    args = parser.parse_args()
+
+    for num_cars in (int(count) for count in args.counts.split(",")):
+        print_report(num_cars, *run_benchmark(num_cars, args))
+
+
+if __name__ == "__main__":
+    main()
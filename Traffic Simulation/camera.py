@@ -0,0 +1,39 @@
+class Camera:
+    def __init__(self, screen_x, screen_width, world_x=0.0, zoom=1.0, window_width=None):
+        self.screen_x = screen_x
+        self.screen_width = screen_width
+        # машины видны до краёв окна, а не только над дорогой
+        if window_width is None:
+            window_width = screen_x * 2 + screen_width
+        self.window_width = window_width
+        self.x = world_x
+        self.zoom = zoom
+        self.min_zoom = 0.0001
+        self.max_zoom = 4.0
+
+    def to_screen(self, world_x):
+        return self.screen_x + (world_x - self.x) * self.zoom
+
+    def to_world(self, screen_x):
+        return self.x + (screen_x - self.screen_x) / self.zoom
+
+    def visible(self, margin=0):
+        return (self.to_world(-margin), self.to_world(self.window_width + margin))
+
+    def scroll(self, pixels):
+        self.x += pixels / self.zoom
+
+    def zoom_at(self, factor, screen_x):
+        anchor = self.to_world(screen_x)
+        self.zoom = min(self.max_zoom, max(self.min_zoom, self.zoom * factor))
+        self.x = anchor - (screen_x - self.screen_x) / self.zoom
+
+    def center_on(self, world_x):
+        self.x = world_x - self.screen_width / 2 / self.zoom
+
+    def clamp(self, world_min, world_max):
+        span = self.screen_width / self.zoom
+        if world_max - world_min <= span:
+            self.x = world_min
+        else:
+            self.x = min(max(self.x, world_min), world_max - span)
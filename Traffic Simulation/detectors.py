@@ -0,0 +1,153 @@
+import csv
+
+import numpy as np
+
+
+class RollingWindow:
+    def __init__(self, size, width):
+        self.buffer = np.zeros((size, width))
+        self.total = np.zeros(width)
+        self.pos = 0
+        self.filled = 0
+
+    def push(self, values):
+        self.total += values - self.buffer[self.pos]
+        self.buffer[self.pos] = values
+        self.pos = (self.pos + 1) % len(self.buffer)
+        self.filled = min(self.filled + 1, len(self.buffer))
+        # раз в оборот пересчитываем сумму, чтобы не копилась ошибка округления
+        if self.pos == 0:
+            self.total[:] = self.buffer.sum(axis=0)
+
+    def mean(self):
+        return self.total / max(self.filled, 1)
+
+    def clear(self):
+        self.buffer[:] = 0
+        self.total[:] = 0
+        self.pos = 0
+        self.filled = 0
+
+
+class DetectorArray:
+    def __init__(self, positions, road_length, step_dt, window_steps=1800,
+                 car_length=20, zone_length=200, ring=False):
+        self.positions = np.sort(np.asarray(positions, dtype=np.float64))
+        self.road_length = road_length
+        self.step_dt = step_dt
+        self.car_length = car_length
+        self.zone_length = zone_length
+        self.ring = ring
+
+        m = len(self.positions)
+        # на кольце машина может пересечь детектор, перескочив через конец дороги
+        if ring:
+            self.crossing_points = np.concatenate([self.positions, self.positions + road_length])
+        else:
+            self.crossing_points = self.positions
+        self.step_counts = np.zeros(m)
+        self.step_speed = np.zeros(m)
+
+        self.counts = RollingWindow(window_steps, m)
+        self.speed_sums = RollingWindow(window_steps, m)
+        self.occupancy = RollingWindow(window_steps, m)
+        self.density = RollingWindow(window_steps, m)
+
+        self.csv_file = None
+        self.csv_writer = None
+
+    def __len__(self):
+        return len(self.positions)
+
+    def count_crossings(self, x_from, x_to, v):
+        # машина пересекает детектор d, если x_from < d <= x_to
+        points = self.crossing_points
+        m = len(self.positions)
+        first = np.searchsorted(points, x_from, side="right")
+        last = np.searchsorted(points, x_to, side="right")
+        crossed = last > first
+        if not np.any(crossed):
+            return
+        first = first[crossed]
+        last = last[crossed]
+        size = len(points) + 1
+        # разностный массив учитывает и пересечение нескольких детекторов за шаг
+        hits = np.cumsum(np.bincount(first, minlength=size) - np.bincount(last, minlength=size))
+        speed = np.cumsum(np.bincount(first, weights=v[crossed], minlength=size)
+                          - np.bincount(last, weights=v[crossed], minlength=size))
+        hits = hits[:len(points)].reshape(-1, m).sum(axis=0)
+        speed = speed[:len(points)].reshape(-1, m).sum(axis=0)
+        self.step_counts += hits
+        self.step_speed += speed
+
+    def update(self, road):
+        keys = road.keys()
+        lane_offsets = np.arange(road.lanes)[:, None] * road.lane_span
+
+        # занятость: на скольких полосах корпус машины [x - car_length, x] накрывает детектор
+        d = lane_offsets + self.positions[None, :]
+        covered = (np.searchsorted(keys, d + self.car_length, side="right")
+                   - np.searchsorted(keys, d, side="left"))
+        occupancy = np.minimum(covered, 1).mean(axis=0)
+
+        # плотность: машин на 1000 единиц длины одной полосы в зоне вокруг детектора
+        half = self.zone_length / 2
+        in_zone = (np.searchsorted(keys, d + half) - np.searchsorted(keys, d - half)).sum(axis=0)
+        density = in_zone / road.lanes / self.zone_length * 1000
+
+        self.counts.push(self.step_counts)
+        self.speed_sums.push(self.step_speed)
+        self.occupancy.push(occupancy)
+        self.density.push(density)
+        self.step_counts[:] = 0
+        self.step_speed[:] = 0
+
+    def flows(self):
+        # авт/ч по всем полосам за окно
+        window_time = max(self.counts.filled, 1) * self.step_dt
+        return self.counts.total / window_time * 3600
+
+    def speeds(self):
+        counts = self.counts.total
+        speeds = np.full(len(counts), np.nan)
+        passed = counts > 0
+        speeds[passed] = self.speed_sums.total[passed] / counts[passed]
+        return speeds
+
+    def snapshot(self):
+        return {
+            "flow": self.flows(),
+            "density": self.density.mean(),
+            "occupancy": self.occupancy.mean() * 100,
+            "speed": self.speeds(),
+        }
+
+    def clear(self):
+        self.step_counts[:] = 0
+        self.step_speed[:] = 0
+        for window in (self.counts, self.speed_sums, self.occupancy, self.density):
+            window.clear()
+
+    def open_csv(self, path):
+        self.csv_file = open(path, "w", newline="", encoding="utf-8")
+        self.csv_writer = csv.writer(self.csv_file)
+        self.csv_writer.writerow(["time", "detector", "position", "flow", "density",
+                                  "occupancy", "speed"])
+
+    def write_csv(self, time):
+        if not self.csv_writer:
+            return
+        values = self.snapshot()
+        for k, position in enumerate(self.positions):
+            self.csv_writer.writerow([
+                f"{time:.2f}", k + 1, f"{position:g}",
+                f"{values['flow'][k]:.1f}", f"{values['density'][k]:.2f}",
+                f"{values['occupancy'][k]:.1f}", f"{values['speed'][k]:.3f}",
+            ])
+        self.csv_file.flush()
+
+    def close(self):
+        if self.csv_file:
+            self.csv_file.close()
+            self.csv_file = None
+            self.csv_writer = None
@@ -0,0 +1,510 @@
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from detectors import DetectorArray
+from events import EventQueue, SETTABLE_PARAMS, load_scenario
+from profiling import PhaseTimer
+from recorder import TrajectoryReader, TrajectoryRecorder
+from road import (Road, STATUS_DRIVING, STATUS_BRAKING, STATUS_ACCELERATING,
+                  STATE_NORMAL, STATE_TOO_CLOSE, STATE_FAR)
+
+
+class Snapshot:
+    # опубликованное состояние: отрисовка только читает его, движок пишет в другой буфер
+    def __init__(self, road):
+        self.road = type(road)(road.length, road.lanes, capacity=road.capacity, ring=road.ring)
+        self.sim_time = 0.0
+        self.params = {}
+        self.detectors = None
+        self.replay = None
+        self.network = None
+        self.timings = {}
+
+
+class TrafficEngine:
+    road_class = Road
+
+    def __init__(self, road_length, lanes=1, initial_cars=0, ring=False, scenario=None,
+                 record=None, record_every=1, replay=None, detectors=None, detectors_csv=None):
+        # в режиме воспроизведения физика не считается, кадры берутся из записи
+        self.replay = TrajectoryReader(replay) if replay else None
+        self.replay_time = 0.0
+        self.replay_speed = 1.0
+        self.replay_paused = False
+        self.replay_frame = -1
+        if self.replay:
+            road_length = self.replay.meta["road_length"]
+            lanes = self.replay.meta["lanes"]
+            ring = self.replay.meta["ring"]
+            initial_cars = 0
+            scenario = None
+
+        # кольцевая дорога: фиксированное число машин, без появления и удаления
+        self.ring = ring
+        self.road = self.road_class(road_length, lanes, capacity=max(256, initial_cars), ring=ring)
+
+        self.spawn_rate = 0.6
+        self.next_car_id = 0
+
+        # время симуляции идёт фиксированными шагами, а не по часам,
+        # поэтому прогоны со сценарием воспроизводимы
+        self.steps_per_second = 60
+        self.step_dt = 1 / self.steps_per_second
+        self.step_count = 0
+        self.sim_time = 0.0
+        # время всех прогонов до последнего сброса: запись и CSV детекторов
+        # продолжаются после R, и их время не должно идти назад
+        self.time_offset = 0.0
+        self.events = EventQueue()
+        self.event_handlers = {
+            "arrival": self.on_arrival,
+            "brake": self.on_brake,
+            "brake_end": self.on_brake_end,
+            "set": self.on_set,
+            "sample": self.on_sample,
+        }
+        self.arrivals_scheduled = False
+        self.sample_listeners = [self.print_sample]
+        self.scenario = load_scenario(scenario) if scenario else None
+        if self.scenario:
+            self.check_scenario_lanes()
+
+        self.desired_distance = 80
+        self.safe_distance = 60
+        self.max_speed = 3.5
+        self.min_speed = 0.1
+        self.acceleration = 2.0
+        self.braking_power = 4.0
+
+        self.target_speed = 2.8
+
+        # смена полосы: выигрыш в дистанции до лидера, после которого машина
+        # перестраивается, и небольшое предпочтение правой полосы
+        self.lane_change_threshold = 30
+        self.keep_right_bias = 10
+        self.lane_change_cooldown = 60
+
+        self.brake_duration = 3.0
+
+        if ring and not initial_cars:
+            # промежуток чуть больше желаемой дистанции: поток свободный,
+            # но одно торможение уже запускает волну
+            initial_cars = int(road_length / (self.desired_distance * 1.4)) * lanes
+        self.initial_cars = initial_cars
+        self.initial_params = {name: getattr(self, name) for name in SETTABLE_PARAMS}
+
+        # виртуальные петлевые детекторы; по умолчанию три на равных расстояниях
+        self.detectors = None
+        if not self.replay:
+            if detectors is None:
+                detectors = [road_length * k / 4 for k in (1, 2, 3)]
+            if len(detectors):
+                self.detectors = DetectorArray(detectors, road_length, self.step_dt, ring=ring)
+                if detectors_csv:
+                    self.detectors.open_csv(detectors_csv)
+
+        # команды от интерфейса выполняются движком в начале шага, в его потоке
+        self.commands = queue.SimpleQueue()
+
+        # двойной буфер: отрисовка читает front под замком, движок пишет в back
+        self.front = Snapshot(self.road)
+        self.back = Snapshot(self.road)
+        self.front_lock = threading.Lock()
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.error = None
+        # скользящее время фаз шага, уходит в снимок для оверлея профилировки
+        self.timer = PhaseTimer()
+
+        self.reset()
+
+        self.recorder = None
+        self.record_every = record_every
+        if record:
+            self.recorder = TrajectoryRecorder(record, {
+                "road_length": self.road.length,
+                "lanes": self.road.lanes,
+                "ring": self.ring,
+                "steps_per_second": self.steps_per_second,
+                "record_every": record_every,
+            })
+
+        self.publish()
+        self.timer.clear()
+
+    def create_car(self, lane=None, speed=None):
+        if speed is None:
+            speed = self.target_speed * random.uniform(0.8, 1.2)
+        speed = np.clip(speed, self.min_speed, self.max_speed)
+
+        car_id = self.next_car_id
+        self.next_car_id += 1
+
+        start_x = -50 - random.randint(0, 100)
+
+        if lane is None:
+            lane = random.randrange(self.road.lanes)
+        self.road.insert(start_x, speed, car_id, lane)
+        return car_id
+
+    def schedule_arrivals(self):
+        if self.ring or self.arrivals_scheduled or self.spawn_rate <= 0:
+            return
+        self.events.schedule(self.sim_time + random.expovariate(self.spawn_rate),
+                             "arrival", stream=True)
+        self.arrivals_scheduled = True
+
+    def check_scenario_lanes(self):
+        # число полос сценарий не знает, его знает только дорога
+        for time, kind, data in self.scenario["events"]:
+            lane = data.get("lane")
+            if kind == "arrival" and lane is not None and not 0 <= lane < self.road.lanes:
+                raise ValueError(f"Событие {kind} в {time} с: нет полосы {lane}, "
+                                 f"на дороге {self.road.lanes}")
+
+    def on_arrival(self, stream=False, lane=None, speed=None):
+        if self.ring:
+            return
+        # полос могли убавить уже после загрузки сценария
+        if lane is None or 0 <= lane < self.road.lanes:
+            self.create_car(lane, speed)
+        if stream:
+            self.arrivals_scheduled = False
+            self.schedule_arrivals()
+
+    def brake_car(self, car_id, duration):
+        idx = self.road.find(car_id)
+        if idx < 0:
+            return False
+        until = self.sim_time + duration
+        self.road.braking[idx] = True
+        self.road.brake_until[idx] = max(until, self.road.brake_until[idx])
+        self.events.schedule(until, "brake_end", car=car_id)
+        return True
+
+    def on_brake(self, car, duration=None):
+        if duration is None:
+            duration = self.brake_duration
+        if self.brake_car(car, duration):
+            print(f"[{self.sim_time:.1f} с] Машина #{car} тормозит на {duration:.1f} сек!")
+
+    def on_brake_end(self, car):
+        idx = self.road.find(car)
+        # более позднее торможение той же машины продлевает его
+        if idx >= 0 and self.road.brake_until[idx] <= self.sim_time:
+            self.road.braking[idx] = False
+
+    def on_set(self, param, value):
+        setattr(self, param, value)
+        if param == "spawn_rate":
+            self.schedule_arrivals()
+
+    def on_sample(self, period=None):
+        for listener in self.sample_listeners:
+            listener(self.sim_time)
+        if period:
+            self.events.schedule(self.sim_time + period, "sample", period=period)
+
+    def print_sample(self, sim_time):
+        n = self.road.count
+        avg_speed = self.road.v[:n].mean() if n else 0
+        print(f"[{sim_time:.1f} с] машин: {n}, средняя скорость: {avg_speed:.2f}")
+
+    def process_events(self):
+        for _, kind, data in self.events.pop_due(self.sim_time):
+            with self.timer.phase("spawn" if kind == "arrival" else "events"):
+                self.event_handlers[kind](**data)
+
+    def populate(self, num_cars):
+        # машины раскладываются по полосам по очереди, и в каждой полосе
+        # промежутки равны: иначе пробка есть уже в начале опыта
+        lanes = np.arange(num_cars) % self.road.lanes
+        per_lane = np.bincount(lanes, minlength=self.road.lanes)
+        spacing = self.road.length / per_lane[lanes]
+        rank = np.arange(num_cars) // self.road.lanes
+        x = rank * spacing + np.random.uniform(0, 0.2, num_cars) * spacing
+        v = np.clip(self.target_speed * np.random.uniform(0.8, 1.2, num_cars),
+                    self.min_speed, self.max_speed)
+        ids = np.arange(self.next_car_id, self.next_car_id + num_cars)
+        self.next_car_id += num_cars
+        self.road.fill(x, v, ids, lanes)
+
+    def update_car_physics(self):
+        road = self.road
+        n = road.count
+        if n == 0:
+            return
+
+        x = road.x[:n]
+        v = road.v[:n]
+        braking = road.braking[:n]
+        state = road.state[:n]
+        status = road.status[:n]
+
+        v[braking] = np.maximum(self.min_speed, v[braking] * 0.7)
+
+        leader, distance = road.leaders()
+        has_front = leader >= 0
+        v_front = np.where(has_front, v[leader], np.inf)
+
+        too_close = distance < self.safe_distance
+        close = ~too_close & (distance < self.desired_distance)
+        far = has_front & (distance > self.desired_distance * 1.2)
+        faster = has_front & (v > v_front)
+        slow = ~has_front & (v < self.target_speed)
+
+        dv = np.select(
+            [too_close, close, far, has_front, slow],
+            [-self.braking_power * (1.0 - distance / self.safe_distance),
+             -self.acceleration * (1.0 - distance / self.desired_distance),
+             self.acceleration * np.minimum(1.0, (distance - self.desired_distance) / 100),
+             0.0,
+             self.acceleration * 0.5],
+            -self.acceleration * 0.2)
+        dv -= np.where(faster, self.acceleration * 0.3, 0.0)
+
+        state[:] = np.select([too_close, far], [STATE_TOO_CLOSE, STATE_FAR], STATE_NORMAL)
+        status[:] = np.select(
+            [faster | too_close | close, far | slow, has_front],
+            [STATUS_BRAKING, STATUS_ACCELERATING, STATUS_DRIVING],
+            STATUS_BRAKING)
+
+        v += dv * 0.05
+        np.clip(v, self.min_speed, self.max_speed, out=v)
+        if self.detectors:
+            self.detectors.count_crossings(x, x + v, v)
+        x += v
+        if road.ring:
+            np.mod(x, road.length, out=x)
+
+        road.resort()
+
+    def change_lanes(self):
+        road = self.road
+        n = road.count
+        if road.lanes < 2 or n == 0:
+            return
+
+        lane = road.lane[:n]
+        cooldown = road.lane_cooldown[:n]
+        np.maximum(cooldown - 1, 0, out=cooldown)
+
+        # на чётных шагах перестраиваются влево, на нечётных вправо, чтобы
+        # две машины с соседних полос не заняли один и тот же промежуток
+        direction = 1 if self.step_count % 2 == 0 else -1
+        target = lane + direction
+        candidates = (target >= 0) & (target < road.lanes) & (cooldown == 0) & ~road.braking[:n]
+        if not np.any(candidates):
+            return
+
+        lookahead = self.desired_distance * 3
+        _, own_gap = road.leaders()
+        _, lead_gap, _, follow_gap = road.neighbors_in(target)
+        advantage = np.minimum(lead_gap, lookahead) - np.minimum(own_gap, lookahead)
+        advantage += self.keep_right_bias if direction < 0 else -self.keep_right_bias
+
+        change = (candidates
+                  & (advantage > self.lane_change_threshold)
+                  & (lead_gap > self.safe_distance)
+                  & (follow_gap > self.safe_distance))
+        if not np.any(change):
+            return
+
+        lane[change] = target[change]
+        cooldown[change] = self.lane_change_cooldown
+        road.resort()
+
+    def remove_offroad_cars(self):
+        if not self.ring:
+            self.road.remove_beyond(self.road.length + 200)
+
+    def reset(self):
+        self.road.clear()
+        self.next_car_id = 0
+        self.time_offset += self.sim_time
+        self.step_count = 0
+        self.sim_time = 0.0
+        self.events.clear()
+        self.arrivals_scheduled = False
+        if self.detectors:
+            self.detectors.clear()
+
+        if self.scenario:
+            # сценарий меняет параметры по ходу, при повторе начинаем с исходных
+            for name, value in self.initial_params.items():
+                setattr(self, name, value)
+            if self.scenario["seed"] is not None:
+                random.seed(self.scenario["seed"])
+                np.random.seed(self.scenario["seed"])
+            for time, kind, data in self.scenario["events"]:
+                self.events.schedule(time, kind, **data)
+
+        if self.replay:
+            self.replay_frame = -1
+            self.seek_replay(self.replay.start_time)
+            return
+
+        if self.initial_cars:
+            self.populate(self.initial_cars)
+        self.schedule_arrivals()
+
+    def step(self):
+        timer = self.timer
+        with timer.phase("commands"):
+            self.apply_commands()
+        if self.replay:
+            with timer.phase("replay"):
+                self.replay_step()
+            timer.commit()
+            return
+
+        self.process_events()
+        with timer.phase("lanes"):
+            self.change_lanes()
+        with timer.phase("physics"):
+            self.update_car_physics()
+        with timer.phase("cleanup"):
+            self.remove_offroad_cars()
+        self.step_count += 1
+        self.sim_time = self.step_count / self.steps_per_second
+
+        if self.detectors:
+            with timer.phase("detectors"):
+                self.detectors.update(self.road)
+                if self.step_count % self.steps_per_second == 0:
+                    self.detectors.write_csv(self.time_offset + self.sim_time)
+
+        if self.recorder and self.step_count % self.record_every == 0:
+            with timer.phase("record"):
+                self.recorder.record(self.time_offset + self.sim_time, self.road)
+        timer.commit()
+
+    def replay_step(self):
+        if not self.replay_paused:
+            self.seek_replay(self.replay_time + self.step_dt * self.replay_speed)
+
+    def seek_replay(self, time):
+        if not len(self.replay):
+            return
+        self.replay_time = min(max(time, self.replay.start_time), self.replay.end_time)
+        k = self.replay.frame_index(self.replay_time)
+        if k != self.replay_frame:
+            self.road.lanes = self.replay.frame_lanes(k)
+            self.road.load_records(self.replay.frame(k))
+            self.replay_frame = k
+        self.sim_time = self.replay_time
+
+    def set_lanes(self, lanes):
+        self.road.set_lanes(lanes)
+
+    def adjust(self, param, delta, low, high):
+        self.on_set(param, min(high, max(low, getattr(self, param) + delta)))
+
+    def toggle_replay_pause(self):
+        self.replay_paused = not self.replay_paused
+
+    def seek_replay_by(self, seconds):
+        self.seek_replay(self.replay_time + seconds)
+
+    def scale_replay_speed(self, factor):
+        self.replay_speed = min(16.0, max(0.25, self.replay_speed * factor))
+
+    def send(self, command, *args):
+        self.commands.put((command, args))
+
+    def apply_commands(self):
+        while True:
+            try:
+                command, args = self.commands.get_nowait()
+            except queue.Empty:
+                return
+            getattr(self, command)(*args)
+
+    def publish(self, wait=False):
+        back = self.back
+        with self.timer.phase("publish"):
+            self.road.copy_to(back.road)
+            self.fill_snapshot(back)
+
+        # если отрисовка сейчас читает front, не ждём её: back перезапишется
+        # на следующем шаге и будет опубликован позже
+        if not self.front_lock.acquire(blocking=wait):
+            return False
+        self.front, self.back = back, self.front
+        self.front_lock.release()
+        return True
+
+    def fill_snapshot(self, back):
+        back.timings = self.timer.means()
+        back.sim_time = self.sim_time
+        back.params = {
+            "desired_distance": self.desired_distance,
+            "safe_distance": self.safe_distance,
+            "max_speed": self.max_speed,
+            "target_speed": self.target_speed,
+            "spawn_rate": self.spawn_rate,
+            "brake_duration": self.brake_duration,
+            "ring": self.ring,
+        }
+        if self.detectors:
+            back.detectors = dict(self.detectors.snapshot(), positions=self.detectors.positions)
+        if self.replay:
+            back.replay = {
+                "time": self.replay_time,
+                "end": self.replay.end_time,
+                "speed": self.replay_speed,
+                "paused": self.replay_paused,
+            }
+
+    @contextmanager
+    def frame(self):
+        with self.front_lock:
+            yield self.front
+
+    def run_loop(self):
+        next_step = time.perf_counter()
+        while not self.stop_event.is_set():
+            try:
+                self.step()
+                self.publish()
+            except Exception as error:
+                # поток завершается, а ошибку поднимет интерфейс через check()
+                self.error = error
+                return
+            next_step += self.step_dt
+            delay = next_step - time.perf_counter()
+            if delay > 0:
+                self.stop_event.wait(delay)
+            elif delay < -0.25:
+                # сильно отстали: не пытаемся догнать, иначе интерфейс получит рывок
+                next_step = time.perf_counter()
+
+    def check(self):
+        if self.error is not None:
+            raise RuntimeError("Поток движка остановился с ошибкой") from self.error
+        if self.thread and not self.thread.is_alive() and not self.stop_event.is_set():
+            raise RuntimeError("Поток движка неожиданно завершился")
+
+    def start(self):
+        self.error = None
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run_loop, name="traffic-engine", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread:
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
+
+    def close(self):
+        self.stop()
+        if self.recorder:
+            self.recorder.close()
+        if self.detectors:
+            self.detectors.close()
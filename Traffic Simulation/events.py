@@ -0,0 +1,105 @@
+import heapq
+import itertools
+import json
+
+
+EVENT_TYPES = ("arrival", "brake", "brake_end", "set", "sample")
+
+# обязательные и необязательные поля события с их типами; сценарий
+# проверяется целиком при загрузке, а не падает посреди прогона
+EVENT_FIELDS = {
+    "arrival": ({}, {"stream": bool, "lane": int, "speed": float}),
+    "brake": ({"car": int}, {"duration": float}),
+    "brake_end": ({"car": int}, {}),
+    "set": ({"param": str, "value": float}, {}),
+    "sample": ({}, {"period": float}),
+}
+
+# скорость и длительности отрицательными не бывают
+NON_NEGATIVE_FIELDS = ("speed", "duration", "period")
+
+# параметры, которые сценарий может менять на ходу
+SETTABLE_PARAMS = (
+    "spawn_rate",
+    "target_speed",
+    "desired_distance",
+    "safe_distance",
+    "max_speed",
+    "min_speed",
+    "acceleration",
+    "braking_power",
+)
+
+
+class EventQueue:
+    def __init__(self):
+        self.heap = []
+        # порядковый номер разрешает равенство времён в порядке добавления
+        self.counter = itertools.count()
+
+    def schedule(self, time, kind, **data):
+        heapq.heappush(self.heap, (time, next(self.counter), kind, data))
+
+    def pop_due(self, now):
+        heap = self.heap
+        while heap and heap[0][0] <= now:
+            time, _, kind, data = heapq.heappop(heap)
+            yield time, kind, data
+
+    def clear(self):
+        self.heap.clear()
+
+
+def convert_field(value, kind):
+    if kind is int:
+        # номер машины или полосы: 17.0 допустимо, 17.5 - нет
+        number = float(value)
+        if not number.is_integer():
+            raise ValueError(value)
+        return int(number)
+    if kind is float:
+        return float(value)
+    if kind is bool:
+        if not isinstance(value, bool):
+            raise ValueError(value)
+        return value
+    if not isinstance(value, kind):
+        raise ValueError(value)
+    return value
+
+
+def check_event(time, kind, event):
+    required, optional = EVENT_FIELDS[kind]
+    for name in required:
+        if name not in event:
+            raise ValueError(f"Событие {kind} в {time} с: нет поля {name}")
+    checked = {}
+    for name, value in event.items():
+        field_type = required.get(name, optional.get(name))
+        if field_type is None:
+            raise ValueError(f"Событие {kind} в {time} с: лишнее поле {name}")
+        try:
+            checked[name] = convert_field(value, field_type)
+        except (TypeError, ValueError):
+            raise ValueError(f"Событие {kind} в {time} с: неверное значение {name}={value!r}") from None
+        if name in NON_NEGATIVE_FIELDS and checked[name] < 0:
+            raise ValueError(f"Событие {kind} в {time} с: отрицательное значение {name}={value!r}")
+    if kind == "set" and checked["param"] not in SETTABLE_PARAMS:
+        raise ValueError(f"Параметр нельзя менять из сценария: {checked['param']}")
+    return checked
+
+
+def load_scenario(path):
+    with open(path, encoding="utf-8") as f:
+        scenario = json.load(f)
+
+    events = []
+    for event in scenario.get("events", []):
+        event = dict(event)
+        time = float(event.pop("t"))
+        kind = event.pop("type")
+        if kind not in EVENT_TYPES:
+            raise ValueError(f"Неизвестный тип события: {kind}")
+        events.append((time, kind, check_event(time, kind, event)))
+
+    return {"seed": scenario.get("seed"), "events": events}
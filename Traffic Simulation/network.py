@@ -0,0 +1,311 @@
+import random
+
+import numpy as np
+
+from engine import TrafficEngine
+from road import Road
+
+
+# соседи клетки в том же порядке, что и в Node.add_neighbors из A*/A_star.py
+NEIGHBOR_OFFSETS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+
+
+class GridNetwork:
+    # сетка как в A*: клетка grid[x][y] - перекрёсток, соседние клетки связаны
+    # улицами в обе стороны; препятствие непроходимо, въезд в болото стоит 2
+    def __init__(self, cols, rows, obstacles=None, swamps=None, edge_length=300):
+        self.cols = cols
+        self.rows = rows
+        self.edge_length = edge_length
+
+        self.obstacle = np.zeros((cols, rows), dtype=bool)
+        self.swamp = np.zeros((cols, rows), dtype=bool)
+        for x, y in obstacles or []:
+            if 0 <= x < cols and 0 <= y < rows:
+                self.obstacle[x, y] = True
+        for x, y in swamps or []:
+            if 0 <= x < cols and 0 <= y < rows:
+                self.swamp[x, y] = True
+
+        # номер узла - x * rows + y
+        self.num_nodes = cols * rows
+        self.node_x = np.repeat(np.arange(cols), rows)
+        self.node_y = np.tile(np.arange(rows), cols)
+
+        edge_from = []
+        edge_to = []
+        for x in range(cols):
+            for y in range(rows):
+                if self.obstacle[x, y]:
+                    continue
+                for dx, dy in NEIGHBOR_OFFSETS:
+                    nx, ny = x + dx, y + dy
+                    if 0 <= nx < cols and 0 <= ny < rows and not self.obstacle[nx, ny]:
+                        edge_from.append(x * rows + y)
+                        edge_to.append(nx * rows + ny)
+        self.edge_from = np.array(edge_from, dtype=np.int64)
+        self.edge_to = np.array(edge_to, dtype=np.int64)
+        self.num_edges = len(self.edge_from)
+        self.base_cost = np.where(self.swamp.ravel()[self.edge_to], 2.0, 1.0)
+
+        # исходящие улицы узла, не больше четырёх; пустые места - -1
+        self.out_edge = np.full((self.num_nodes, 4), -1, dtype=np.int64)
+        slot = np.zeros(self.num_nodes, dtype=np.int64)
+        for e, u in enumerate(edge_from):
+            self.out_edge[u, slot[u]] = e
+            slot[u] += 1
+        self.out_target = np.where(self.out_edge >= 0, self.edge_to[self.out_edge], 0)
+
+    @classmethod
+    def random(cls, cols, rows, obstacle_percent=10, swamp_percent=10, edge_length=300):
+        # как пункт 5 в A*: случайные препятствия и болота по проценту клеток
+        cells = [(x, y) for x in range(cols) for y in range(rows)]
+        random.shuffle(cells)
+        num_obstacles = len(cells) * obstacle_percent // 100
+        num_swamps = len(cells) * swamp_percent // 100
+        obstacles = cells[:num_obstacles]
+        swamps = cells[num_obstacles:num_obstacles + num_swamps]
+        return cls(cols, rows, obstacles, swamps, edge_length)
+
+    def passable_nodes(self):
+        return np.flatnonzero(~self.obstacle.ravel())
+
+
+class RouteTable:
+    # маршруты ко всем зонам назначения сразу: машина хранит только зону,
+    # а следующую улицу на каждом перекрёстке берёт из общей таблицы
+    def __init__(self, network, zones, smoothing=0.5, max_load=20.0):
+        self.network = network
+        self.zones = np.asarray(zones, dtype=np.int64)
+        self.zone_row = np.full(network.num_nodes, -1, dtype=np.int64)
+        self.zone_row[self.zones] = np.arange(len(self.zones))
+        self.smoothing = smoothing
+        self.max_load = max_load
+        self.updates = 0
+        self.reset()
+
+    def reset(self):
+        self.load = np.ones(self.network.num_edges)
+        self.compute()
+
+    def compute(self):
+        net = self.network
+        costs = net.base_cost * self.load
+        out_cost = np.where(net.out_edge >= 0, costs[net.out_edge], np.inf)
+
+        # обратный Беллман-Форд по всем зонам за раз: dist[z, u] - стоимость пути
+        # от узла u до зоны z; итераций не больше числа улиц в самом длинном пути
+        k = len(self.zones)
+        dist = np.full((k, net.num_nodes), np.inf)
+        dist[np.arange(k), self.zones] = 0
+        for _ in range(net.num_nodes):
+            via = dist[:, net.out_target] + out_cost
+            best = np.minimum(via.min(axis=2), dist)
+            if np.array_equal(best, dist):
+                break
+            dist = best
+
+        choice = via.argmin(axis=2)
+        next_hop = net.out_edge[np.arange(net.num_nodes), choice]
+        next_hop[~np.isfinite(dist)] = -1
+        next_hop[np.arange(k), self.zones] = -1
+        self.dist = dist
+        self.next_hop = next_hop
+        self.updates += 1
+
+    def update_load(self, load):
+        # сглаживаем, чтобы маршруты не метались между двумя улицами
+        load = np.clip(load, 1.0, self.max_load)
+        self.load = self.smoothing * load + (1 - self.smoothing) * self.load
+        self.compute()
+
+    def next_edge(self, dest, node):
+        return self.next_hop[self.zone_row[dest], node]
+
+    def reachable_zones(self, node):
+        return self.zones[np.isfinite(self.dist[:, node])]
+
+
+class NetworkRoad(Road):
+    # "полоса" - номер улицы сети, x - расстояние от её начала
+    FIELDS = (
+        ("lane", np.int32),
+        ("x", np.float64),
+        ("v", np.float64),
+        ("braking", np.bool_),
+        ("brake_until", np.float64),
+        ("ids", np.int64),
+        ("state", np.int8),
+        ("status", np.int8),
+        ("lane_cooldown", np.int16),
+        ("dest", np.int64),
+        ("next_lane", np.int64),
+        ("departed", np.float64),
+    )
+
+    def leaders(self):
+        leader, gaps = super().leaders()
+        n = self.count
+        # последняя машина на улице смотрит через перекрёсток
+        # на последнюю въехавшую машину следующей улицы своего маршрута
+        rows = np.flatnonzero((leader < 0) & (self.next_lane[:n] >= 0))
+        if len(rows):
+            bounds = self.lane_bounds()
+            target = self.next_lane[rows]
+            first = bounds[target]
+            occupied = first < bounds[target + 1]
+            rows = rows[occupied]
+            first = first[occupied]
+            leader[rows] = first
+            gaps[rows] = self.length - self.x[rows] + self.x[first]
+        return leader, gaps
+
+
+class NetworkEngine(TrafficEngine):
+    road_class = NetworkRoad
+
+    def __init__(self, network, zones=12, initial_cars=0, spawn_rate=2.0, reroute_period=5.0,
+                 scenario=None):
+        self.network = network
+        passable = network.passable_nodes()
+        zones = np.sort(np.random.choice(passable, min(zones, len(passable)), replace=False))
+        self.routes = RouteTable(network, zones)
+        self.reroute_period = reroute_period
+        self.arrived = 0
+        self.trip_time_total = 0.0
+
+        super().__init__(network.edge_length, network.num_edges, initial_cars,
+                         scenario=scenario, detectors=[])
+        self.event_handlers["reroute"] = self.on_reroute
+        self.on_set("spawn_rate", spawn_rate)
+
+    def reset(self):
+        self.arrived = 0
+        self.trip_time_total = 0.0
+        self.routes.reset()
+        super().reset()
+        self.events.schedule(self.reroute_period, "reroute", period=self.reroute_period)
+
+    def create_car(self, lane=None, speed=None):
+        road = self.road
+        net = self.network
+        if lane is None:
+            lane = random.randrange(net.num_edges)
+        start, end = road.lane_bounds()[lane:lane + 2]
+        # въезд на улицу занят - машина не появляется
+        if end > start and road.x[start] < self.safe_distance:
+            return -1
+        zones = self.routes.reachable_zones(net.edge_to[lane])
+        if not len(zones):
+            return -1
+
+        if speed is None:
+            speed = self.target_speed * random.uniform(0.8, 1.2)
+        speed = np.clip(speed, self.min_speed, self.max_speed)
+        car_id = self.next_car_id
+        self.next_car_id += 1
+
+        dest = int(random.choice(zones))
+        k = road.insert(0.0, speed, car_id, lane)
+        road.dest[k] = dest
+        road.next_lane[k] = self.routes.next_edge(dest, net.edge_to[lane])
+        road.departed[k] = self.sim_time
+        return car_id
+
+    def populate(self, num_cars):
+        net = self.network
+        routes = self.routes
+        edges = np.sort(np.random.randint(0, net.num_edges, num_cars))
+
+        # случайная зона из достижимых с конца улицы
+        reach = np.isfinite(routes.dist[:, net.edge_to[edges]])
+        pick = np.where(reach, np.random.random(reach.shape), -1.0).argmax(axis=0)
+        valid = reach.any(axis=0)
+        edges = edges[valid]
+        dest = routes.zones[pick[valid]]
+        num_cars = len(edges)
+
+        # машины одной улицы расставлены равномерно по её длине
+        counts = np.bincount(edges, minlength=net.num_edges)
+        first = np.cumsum(counts) - counts
+        rank = np.arange(num_cars) - first[edges]
+        x = (rank + np.random.uniform(0, 0.2, num_cars)) * net.edge_length / counts[edges]
+        v = np.clip(self.target_speed * np.random.uniform(0.8, 1.2, num_cars),
+                    self.min_speed, self.max_speed)
+        ids = np.arange(self.next_car_id, self.next_car_id + num_cars)
+
+        road = self.road
+        road.fill(x, v, ids, edges)
+        n = road.count
+        road.dest[:n] = dest[road.ids[:n] - self.next_car_id]
+        road.departed[:n] = self.sim_time
+        self.next_car_id += num_cars
+        self.update_routes()
+
+    def update_routes(self):
+        road = self.road
+        n = road.count
+        node = self.network.edge_to[road.lane[:n]]
+        road.next_lane[:n] = self.routes.next_edge(road.dest[:n], node)
+
+    def edge_load(self):
+        # во сколько раз проезд по улице медленнее свободного
+        road = self.road
+        n = road.count
+        lanes = road.lane[:n]
+        num_edges = self.network.num_edges
+        counts = np.bincount(lanes, minlength=num_edges)
+        speed = np.bincount(lanes, weights=road.v[:n], minlength=num_edges)
+        mean_speed = np.where(counts > 0, speed / np.maximum(counts, 1), self.target_speed)
+        return self.target_speed / np.maximum(mean_speed, self.min_speed)
+
+    def on_reroute(self, period=None):
+        self.routes.update_load(self.edge_load())
+        self.update_routes()
+        if period:
+            self.events.schedule(self.sim_time + period, "reroute", period=period)
+
+    def change_lanes(self):
+        # на улице одна полоса, перестроений нет
+        pass
+
+    def set_lanes(self, lanes):
+        pass
+
+    def remove_offroad_cars(self):
+        road = self.road
+        n = road.count
+        x = road.x[:n]
+        past = x >= road.length
+        if not np.any(past):
+            return
+
+        # доехавшие до перекрёстка переходят на следующую улицу маршрута
+        next_lane = road.next_lane[:n]
+        arrived = past & (next_lane < 0)
+        turning = np.flatnonzero(past & (next_lane >= 0))
+        road.lane[turning] = next_lane[turning]
+        x[turning] -= road.length
+        road.next_lane[turning] = self.routes.next_edge(
+            road.dest[turning], self.network.edge_to[road.lane[turning]])
+
+        if np.any(arrived):
+            self.arrived += int(np.count_nonzero(arrived))
+            self.trip_time_total += float(np.sum(self.sim_time - road.departed[:n][arrived]))
+            road.remove_rows(arrived)
+        road.resort()
+
+    def print_sample(self, sim_time):
+        super().print_sample(sim_time)
+        if self.arrived:
+            print(f"[{sim_time:.1f} с] доехало: {self.arrived}, "
+                  f"среднее время в пути: {self.trip_time_total / self.arrived:.1f} с")
+
+    def fill_snapshot(self, back):
+        super().fill_snapshot(back)
+        back.network = {
+            "load": self.routes.load,
+            "arrived": self.arrived,
+            "trip_time": self.trip_time_total / self.arrived if self.arrived else 0.0,
+            "route_updates": self.routes.updates,
+        }
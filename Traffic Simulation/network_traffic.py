@@ -0,0 +1,205 @@
+import argparse
+import random
+
+import numpy as np
+import pygame
+
+from network import GridNetwork, NetworkEngine
+from road_traffic import TrafficSimulation
+
+
+class NetworkSimulation(TrafficSimulation):
+    draw_phases = (
+        "draw_network",
+        "draw_network_cars",
+        "draw_statistics",
+        "draw_network_panel",
+        "draw_selected_car_info",
+        "draw_controls",
+    )
+
+    def __init__(self, engine, width=1600, height=900, threaded=True):
+        super().__init__(width, height, threaded=threaded, engine=engine)
+        pygame.display.set_caption("Трафик: городская сеть")
+        net = engine.network
+        self.network = net
+
+        # карта занимает место между панелью статистики и панелью управления
+        area_x, area_width = 360, width - 360 - 420
+        area_y, area_height = 20, height - 40
+        self.cell = min(area_width / net.cols, area_height / net.rows)
+        self.map_x = area_x + (area_width - self.cell * net.cols) / 2
+        self.map_y = area_y + (area_height - self.cell * net.rows) / 2
+        self.map_size = (int(self.cell * net.cols) + 1, int(self.cell * net.rows) + 1)
+
+        # машины едут по правой стороне улицы: сдвиг вправо от направления движения
+        center_x = self.map_x + (net.node_x + 0.5) * self.cell
+        center_y = self.map_y + (net.node_y + 0.5) * self.cell
+        dx = center_x[net.edge_to] - center_x[net.edge_from]
+        dy = center_y[net.edge_to] - center_y[net.edge_from]
+        offset = 0.12
+        self.edge_x0 = center_x[net.edge_from] - dy * offset
+        self.edge_y0 = center_y[net.edge_from] + dx * offset
+        self.edge_dx = dx
+        self.edge_dy = dy
+        self.node_center_x = center_x
+        self.node_center_y = center_y
+
+    def update_camera(self):
+        pass
+
+    def select_next_car(self):
+        if self.road.count == 0:
+            self.selected_car_id = -1
+            return
+        self.select_car((self.selected_index() + 1) % self.road.count)
+
+    def controls(self):
+        return [
+            ("TAB", "Выбрать машину"),
+            ("SPACE", "Тормозить выбранную"),
+            ("R", "Сбросить симуляцию"),
+            ("ВВЕРХ/ВНИЗ", "Интенсивность трафика"),
+            ("ВЛЕВО/ВПРАВО", "Целевая скорость"),
+            ("ПЛЮС/МИНУС", "Желаемая дистанция"),
+            ("P", "Профилировка кадра"),
+        ]
+
+    def build_map(self, surf):
+        net = self.network
+        cell = self.cell
+        ox, oy = self.map_x, self.map_y
+
+        # цвета клеток как в визуализации A*
+        for x in range(net.cols):
+            for y in range(net.rows):
+                if net.obstacle[x, y]:
+                    color = (50, 50, 50)
+                elif net.swamp[x, y]:
+                    color = (139, 69, 19)
+                else:
+                    continue
+                pygame.draw.rect(surf, color, (x * cell + 2, y * cell + 2, cell - 4, cell - 4))
+
+        width = max(2, int(cell * 0.35))
+        for u, w in zip(net.edge_from.tolist(), net.edge_to.tolist()):
+            if u < w:
+                pygame.draw.line(surf, self.road_color,
+                               (self.node_center_x[u] - ox, self.node_center_y[u] - oy),
+                               (self.node_center_x[w] - ox, self.node_center_y[w] - oy), width)
+
+        size = max(4, int(cell * 0.3))
+        for node in self.engine.routes.zones.tolist():
+            pygame.draw.rect(surf, (0, 0, 255),
+                            (self.node_center_x[node] - ox - size / 2,
+                             self.node_center_y[node] - oy - size / 2, size, size))
+
+    def draw_network(self):
+        self.screen.fill(self.bg_color)
+        panel = self.render_cache.panel("network", self.map_size, self.build_map)
+        self.screen.blit(panel, (self.map_x, self.map_y))
+
+        network = self.snapshot.network
+        if not network:
+            return
+        # загруженные улицы подсвечиваются на своей стороне дороги
+        load = network["load"]
+        for e in np.flatnonzero(load > 1.5).tolist():
+            t = min(1.0, (load[e] - 1.5) / 5)
+            color = (255, int(180 * (1 - t)), 40)
+            start = (self.edge_x0[e], self.edge_y0[e])
+            end = (start[0] + self.edge_dx[e], start[1] + self.edge_dy[e])
+            pygame.draw.line(self.screen, color, start, end, 2)
+
+    def car_positions(self):
+        road = self.road
+        n = road.count
+        edge = road.lane[:n]
+        t = np.clip(road.x[:n] / road.length, 0, 1)
+        px = (self.edge_x0[edge] + self.edge_dx[edge] * t).astype(int)
+        py = (self.edge_y0[edge] + self.edge_dy[edge] * t).astype(int)
+        return px, py
+
+    def draw_network_cars(self):
+        road = self.road
+        n = road.count
+        if n == 0:
+            return
+
+        px, py = self.car_positions()
+        t = np.clip(road.v[:n] / self.params["max_speed"], 0, 1)
+        colors = np.empty((n, 3), dtype=np.uint8)
+        colors[:, 0] = 255 * (1 - t)
+        colors[:, 1] = 60 + 160 * t
+        colors[:, 2] = 60
+
+        # тысячи машин рисуются точками прямо в пиксели экрана, без вызова на машину
+        pixels = pygame.surfarray.pixels3d(self.screen)
+        for ox in (-1, 0, 1):
+            for oy in (-1, 0, 1):
+                x = np.clip(px + ox, 0, self.width - 1)
+                y = np.clip(py + oy, 0, self.height - 1)
+                pixels[x, y] = colors
+        del pixels
+
+        idx = self.selected_index()
+        if idx >= 0:
+            pygame.draw.circle(self.screen, self.color_selected,
+                             (int(px[idx]), int(py[idx])), 6, 2)
+
+    def draw_network_panel(self):
+        network = self.snapshot.network
+        if not network:
+            return
+
+        panel_width = 320
+        panel_height = 150
+        panel_x = 20
+        panel_y = 240
+
+        def build(surf):
+            pygame.draw.rect(surf, (0, 0, 0, 200),
+                            (0, 0, panel_width, panel_height), border_radius=8)
+            title = self.font.render("СЕТЬ", True, (100, 180, 255))
+            surf.blit(title, (20, 15))
+
+        panel = self.render_cache.panel("network_panel", (panel_width, panel_height), build)
+        self.screen.blit(panel, (panel_x, panel_y))
+
+        lines = [
+            f"Зон назначения: {len(self.engine.routes.zones)}",
+            f"Доехало: {network['arrived']}",
+            f"Среднее время в пути: {network['trip_time']:.1f} с",
+            f"Пересчётов маршрутов: {network['route_updates']}",
+            f"Загруженных улиц: {int(np.count_nonzero(network['load'] > 1.5))}",
+        ]
+        for i, line in enumerate(lines):
+            text = self.render_cache.label(self.small_font, line, (220, 220, 220))
+            self.screen.blit(text, (panel_x + 20, panel_y + 45 + i * 20))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Трафик в городской сети с маршрутами A*")
+    parser.add_argument("--grid", default="20x12", help="размер сетки, столбцы x строки")
+    parser.add_argument("--obstacles", type=int, default=10,
+                        help="процент непроходимых клеток (0-50)")
+    parser.add_argument("--swamps", type=int, default=10, help="процент болот (0-50)")
+    parser.add_argument("--block", type=float, default=300, help="длина улицы между перекрёстками")
+    parser.add_argument("--cars", type=int, default=1500, help="машин в сети в начале")
+    parser.add_argument("--zones", type=int, default=12, help="число зон назначения")
+    parser.add_argument("--spawn-rate", type=float, default=2.0, help="появление машин в секунду")
+    parser.add_argument("--reroute", type=float, default=5.0,
+                        help="период пересчёта маршрутов по загрузке, сек")
+    parser.add_argument("--seed", type=int, default=None, help="зерно генератора")
+    parser.add_argument("--single-thread", action="store_true",
+                        help="считать физику в потоке отрисовки")
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+        np.random.seed(args.seed)
+    cols, rows = (int(v) for v in args.grid.lower().split("x"))
+    network = GridNetwork.random(cols, rows, args.obstacles, args.swamps, args.block)
+    engine = NetworkEngine(network, args.zones, args.cars, args.spawn_rate, args.reroute)
+    sim = NetworkSimulation(engine, threaded=not args.single_thread)
+    sim.run()
@@ -0,0 +1,37 @@
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class PhaseTimer:
+    def __init__(self, window=60):
+        self.window = window
+        # время фаз текущего шага и скользящая история по шагам
+        self.current = {}
+        self.history = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.current[name] = self.current.get(name, 0.0) + time.perf_counter() - start
+
+    def commit(self):
+        for name, seconds in self.current.items():
+            if name not in self.history:
+                self.history[name] = deque(maxlen=self.window)
+            self.history[name].append(seconds)
+        # фаза, которая в этом шаге не выполнялась, заняла ноль
+        for name, samples in self.history.items():
+            if name not in self.current:
+                samples.append(0.0)
+        self.current = {}
+
+    def means(self):
+        return {name: sum(samples) / len(samples) for name, samples in self.history.items()}
+
+    def clear(self):
+        self.current = {}
+        self.history.clear()
@@ -0,0 +1,169 @@
+import json
+import os
+import sys
+
+import numpy as np
+
+
+RECORD_DTYPE = np.dtype([
+    ("id", "<i4"),
+    ("x", "<f8"),
+    ("v", "<f4"),
+    ("lane", "i1"),
+    ("braking", "u1"),
+    ("state", "i1"),
+    ("status", "i1"),
+])
+
+# одна запись индекса на записанный шаг: время, диапазон записей в файле данных
+# и число полос - его можно менять во время записи
+INDEX_DTYPE = np.dtype([
+    ("time", "<f8"),
+    ("start", "<i8"),
+    ("count", "<i4"),
+    ("lanes", "i1"),
+])
+
+FORMAT_VERSION = 2
+
+
+class TrajectoryRecorder:
+    def __init__(self, path, meta, chunk_records=65536, chunk_steps=4096):
+        self.path = path
+        self.meta = dict(meta)
+        self.data_file = open(path + ".traj", "wb")
+        self.index_file = open(path + ".idx", "wb")
+        # память ограничена размером буферов, всё остальное сразу уходит в файл
+        self.buffer = np.empty(chunk_records, dtype=RECORD_DTYPE)
+        self.filled = 0
+        self.index_buffer = np.empty(chunk_steps, dtype=INDEX_DTYPE)
+        self.index_filled = 0
+        self.total_records = 0
+        self.total_steps = 0
+
+        # метаданные пишутся сразу: если программа упадёт, уже сброшенные
+        # на диск куски останутся читаемыми, а число шагов и записей
+        # читатель берёт из размеров файлов
+        meta = dict(self.meta)
+        meta["version"] = FORMAT_VERSION
+        with open(path + ".json", "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    def record(self, time, road):
+        n = road.count
+        self.index_buffer[self.index_filled] = (time, self.total_records, n, road.lanes)
+        self.index_filled += 1
+        if self.index_filled == len(self.index_buffer):
+            self.flush_index()
+
+        done = 0
+        while done < n:
+            size = min(n - done, len(self.buffer) - self.filled)
+            part = self.buffer[self.filled:self.filled + size]
+            part["id"] = road.ids[done:done + size]
+            part["x"] = road.x[done:done + size]
+            part["v"] = road.v[done:done + size]
+            part["lane"] = road.lane[done:done + size]
+            part["braking"] = road.braking[done:done + size]
+            part["state"] = road.state[done:done + size]
+            part["status"] = road.status[done:done + size]
+            self.filled += size
+            done += size
+            if self.filled == len(self.buffer):
+                self.flush_data()
+
+        self.total_records += n
+        self.total_steps += 1
+
+    def flush_data(self):
+        self.data_file.write(self.buffer[:self.filled].tobytes())
+        self.filled = 0
+
+    def flush_index(self):
+        self.index_file.write(self.index_buffer[:self.index_filled].tobytes())
+        self.index_filled = 0
+
+    def close(self):
+        if self.data_file.closed:
+            return
+        self.flush_data()
+        self.flush_index()
+        self.data_file.close()
+        self.index_file.close()
+
+
+def open_array(path, dtype):
+    # после аварийного завершения последний кусок может быть записан не целиком
+    count = os.path.getsize(path) // dtype.itemsize
+    # memmap не умеет отображать пустой файл
+    if count == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(count,))
+
+
+class TrajectoryReader:
+    def __init__(self, path):
+        with open(path + ".json", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Неподдерживаемая версия записи: {self.meta.get('version')}")
+        self.records = open_array(path + ".traj", RECORD_DTYPE)
+        index = open_array(path + ".idx", INDEX_DTYPE)
+        # шаги, чьи записи не успели попасть в файл данных, отбрасываем
+        complete = index["start"] + index["count"] <= len(self.records)
+        self.index = index[:int(np.count_nonzero(complete))]
+        self.times = np.asarray(self.index["time"])
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def start_time(self):
+        return float(self.times[0]) if len(self.times) else 0.0
+
+    @property
+    def end_time(self):
+        return float(self.times[-1]) if len(self.times) else 0.0
+
+    def frame_index(self, time):
+        k = int(np.searchsorted(self.times, time, side="right")) - 1
+        return min(max(k, 0), len(self.index) - 1)
+
+    def frame(self, k):
+        entry = self.index[k]
+        start = int(entry["start"])
+        return self.records[start:start + int(entry["count"])]
+
+    def frame_lanes(self, k):
+        return int(self.index[k]["lanes"])
+
+    def mean_speeds(self):
+        counts = np.asarray(self.index["count"])
+        nonempty = counts > 0
+        starts = np.asarray(self.index["start"])[nonempty]
+        sums = np.add.reduceat(self.records["v"].astype(np.float64), starts) if len(starts) else []
+        speeds = np.zeros(len(counts))
+        speeds[nonempty] = np.asarray(sums) / counts[nonempty]
+        return self.times, speeds
+
+
+def main():
+    if len(sys.argv) != 2:
+        print("Использование: python recorder.py <путь к записи без расширения>")
+        return
+
+    reader = TrajectoryReader(sys.argv[1])
+    print(f"Шагов: {len(reader)}, записей: {len(reader.records)}")
+    print(f"Время: {reader.start_time:.1f} - {reader.end_time:.1f} с")
+    if not len(reader):
+        return
+
+    times, speeds = reader.mean_speeds()
+    counts = reader.index["count"]
+    # примерно двадцать строк на всю запись
+    for k in range(0, len(reader), max(1, len(reader) // 20)):
+        print(f"[{times[k]:.1f} с] машин: {counts[k]}, средняя скорость: {speeds[k]:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+import pygame
+
+
+class RenderCache:
+    def __init__(self, max_labels=4096):
+        self.max_labels = max_labels
+        self.labels = {}
+        self.panels = {}
+        self.scratch = {}
+
+    def label(self, font, text, color):
+        key = (id(font), text, color)
+        surf = self.labels.get(key)
+        if surf is None:
+            # id машин растут бесконечно, поэтому кэш не должен расти вместе с ними
+            if len(self.labels) >= self.max_labels:
+                self.labels.clear()
+            surf = font.render(text, True, color)
+            self.labels[key] = surf
+        return surf
+
+    def panel(self, key, size, build):
+        surf = self.panels.get(key)
+        if surf is None:
+            surf = pygame.Surface(size, pygame.SRCALPHA)
+            build(surf)
+            self.panels[key] = surf
+        return surf
+
+    def scratch_surface(self, key, size):
+        surf = self.scratch.get(key)
+        if surf is None or surf.get_size() != size:
+            surf = pygame.Surface(size, pygame.SRCALPHA)
+            self.scratch[key] = surf
+        surf.fill((0, 0, 0, 0))
+        return surf
@@ -0,0 +1,308 @@
+import numpy as np
+
+
+STATUS_DRIVING = 0
+STATUS_BRAKING = 1
+STATUS_ACCELERATING = 2
+STATUS_NAMES = ("едет", "тормозит", "разгоняется")
+
+STATE_NORMAL = 0
+STATE_TOO_CLOSE = 1
+STATE_FAR = 2
+
+
+class Road:
+    # поля машины и их типы; массивы отсортированы по полосе, внутри полосы - по x
+    FIELDS = (
+        ("lane", np.int8),
+        ("x", np.float64),
+        ("v", np.float64),
+        ("braking", np.bool_),
+        ("brake_until", np.float64),
+        ("ids", np.int64),
+        ("state", np.int8),
+        ("status", np.int8),
+        ("lane_cooldown", np.int16),
+    )
+
+    def __init__(self, length, lanes=1, capacity=256, ring=False):
+        self.length = length
+        self.lanes = lanes
+        # на кольце x лежит в [0, length), а лидер последней машины полосы - первая
+        self.ring = ring
+        # ширина "полосы" в ключе сортировки lane * lane_span + x
+        self.lane_span = 2.0 * length + 10000
+        self.count = 0
+        for name, dtype in self.FIELDS:
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+
+        # id машины - стабильная ссылка на неё: строки сдвигаются при вставке,
+        # удалении и пересортировке, а таблица id -> строка обновляется вместе с ними.
+        # Живые id почти подряд, поэтому ячейка - это id по модулю размера таблицы
+        size = 1 << max(capacity - 1, 1).bit_length()
+        self.id_rows = np.zeros(size, dtype=np.int64)
+        self.id_keys = np.full(size, -1, dtype=np.int64)
+
+    @property
+    def capacity(self):
+        return len(self.x)
+
+    def clear(self):
+        self.count = 0
+        self.id_keys.fill(-1)
+
+    def reserve(self, capacity):
+        if capacity <= self.capacity:
+            return
+        new_capacity = self.capacity
+        while new_capacity < capacity:
+            new_capacity *= 2
+        for name, dtype in self.FIELDS:
+            old = getattr(self, name)
+            new = np.zeros(new_capacity, dtype=dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    def keys(self):
+        n = self.count
+        return self.lane[:n] * self.lane_span + self.x[:n]
+
+    def lane_bounds(self):
+        # искомые значения того же типа, что и полосы, иначе searchsorted
+        # приводит к общему типу копию всего массива
+        lanes = np.arange(self.lanes + 1, dtype=self.lane.dtype)
+        return np.searchsorted(self.lane[:self.count], lanes)
+
+    def rebuild_index(self):
+        n = self.count
+        ids = self.ids[:n]
+        size = len(self.id_keys)
+        if n:
+            # разные id в пределах окна размера таблицы не делят ячейку
+            span = int(ids.max() - ids.min()) + 1
+            while size < span:
+                size *= 2
+        if size != len(self.id_keys):
+            self.id_rows = np.zeros(size, dtype=np.int64)
+            self.id_keys = np.empty(size, dtype=np.int64)
+        self.id_keys.fill(-1)
+        slots = ids & (size - 1)
+        self.id_keys[slots] = ids
+        self.id_rows[slots] = np.arange(n)
+
+    def insert(self, x, v, car_id, lane=0):
+        self.reserve(self.count + 1)
+        n = self.count
+        bounds = np.array([lane, lane + 1], dtype=self.lane.dtype)
+        start, end = np.searchsorted(self.lane[:n], bounds)
+        k = int(start + np.searchsorted(self.x[start:end], x))
+        mask = len(self.id_keys) - 1
+        self.id_rows[self.ids[k:n] & mask] += 1
+        for name, _ in self.FIELDS:
+            arr = getattr(self, name)
+            arr[k + 1:n + 1] = arr[k:n]
+        self.lane[k] = lane
+        self.x[k] = x
+        self.v[k] = v
+        self.braking[k] = False
+        self.brake_until[k] = 0
+        self.ids[k] = car_id
+        self.state[k] = STATE_NORMAL
+        self.status[k] = STATUS_DRIVING
+        self.lane_cooldown[k] = 0
+        self.count = n + 1
+
+        slot = car_id & mask
+        if self.id_keys[slot] >= 0:
+            # ячейка занята живой машиной: окно id шире таблицы, растим её
+            self.rebuild_index()
+        else:
+            self.id_keys[slot] = car_id
+            self.id_rows[slot] = k
+        return k
+
+    def fill(self, x, v, ids, lanes=None):
+        n = len(x)
+        self.reserve(n)
+        if lanes is None:
+            lanes = np.zeros(n, dtype=np.int8)
+        order = np.lexsort((x, lanes))
+        self.lane[:n] = np.asarray(lanes)[order]
+        self.x[:n] = np.asarray(x)[order]
+        self.v[:n] = np.asarray(v)[order]
+        self.ids[:n] = np.asarray(ids)[order]
+        self.braking[:n] = False
+        self.brake_until[:n] = 0
+        self.state[:n] = STATE_NORMAL
+        self.status[:n] = STATUS_DRIVING
+        self.lane_cooldown[:n] = 0
+        self.count = n
+        self.rebuild_index()
+
+    def copy_to(self, other):
+        n = self.count
+        other.lanes = self.lanes
+        other.reserve(n)
+        for name, _ in self.FIELDS:
+            getattr(other, name)[:n] = getattr(self, name)[:n]
+        other.count = n
+        if len(other.id_keys) != len(self.id_keys):
+            other.id_rows = self.id_rows.copy()
+            other.id_keys = self.id_keys.copy()
+        else:
+            other.id_rows[:] = self.id_rows
+            other.id_keys[:] = self.id_keys
+
+    def load_records(self, records):
+        # кадр записи уже отсортирован так же, как массивы дороги
+        n = len(records)
+        self.reserve(n)
+        self.ids[:n] = records["id"]
+        self.x[:n] = records["x"]
+        self.v[:n] = records["v"]
+        self.lane[:n] = records["lane"]
+        self.braking[:n] = records["braking"]
+        self.state[:n] = records["state"]
+        self.status[:n] = records["status"]
+        self.brake_until[:n] = 0
+        self.lane_cooldown[:n] = 0
+        self.count = n
+        self.rebuild_index()
+
+    def remove_beyond(self, limit):
+        # полоса отсортирована по x, поэтому уехавшие машины - её хвост:
+        # проверка стоит O(полос), удаление - O(удалённых) плюс сдвиг следующих полос
+        bounds = self.lane_bounds()
+        starts, ends = bounds[:-1], bounds[1:]
+        over = (ends > starts) & (self.x[np.maximum(ends - 1, 0)] >= limit)
+        if not np.any(over):
+            return 0
+
+        mask = len(self.id_keys) - 1
+        removed = 0
+        for lane in range(self.lanes):
+            start, end = int(starts[lane]), int(ends[lane])
+            cut = end
+            if over[lane]:
+                cut = start + int(np.searchsorted(self.x[start:end], limit))
+                self.id_keys[self.ids[cut:end] & mask] = -1
+            if removed and cut > start:
+                for name, _ in self.FIELDS:
+                    arr = getattr(self, name)
+                    arr[start - removed:cut - removed] = arr[start:cut]
+                self.id_rows[self.ids[start - removed:cut - removed] & mask] -= removed
+            removed += end - cut
+        self.count -= removed
+        return removed
+
+    def remove_rows(self, drop):
+        n = self.count
+        mask = len(self.id_keys) - 1
+        self.id_keys[self.ids[:n][drop] & mask] = -1
+        keep = ~drop
+        m = int(np.count_nonzero(keep))
+        for name, _ in self.FIELDS:
+            arr = getattr(self, name)
+            arr[:m] = arr[:n][keep]
+        self.count = m
+        self.id_rows[self.ids[:m] & mask] = np.arange(m)
+        return n - m
+
+    def resort(self):
+        n = self.count
+        keys = self.keys()
+        # между шагами порядок почти всегда сохраняется, поэтому
+        # пересортировка нужна только после обгонов и смен полосы
+        if n < 2 or not np.any(keys[1:] < keys[:-1]):
+            return
+        order = np.argsort(keys, kind="stable")
+        for name, _ in self.FIELDS:
+            arr = getattr(self, name)
+            arr[:n] = arr[:n][order]
+        self.id_rows[self.ids[:n] & (len(self.id_keys) - 1)] = np.arange(n)
+
+    def leaders(self):
+        # лидер машины - следующая в массиве, если она на той же полосе
+        n = self.count
+        x = self.x[:n]
+        leader = np.full(n, -1)
+        gaps = np.full(n, np.inf)
+        if n >= 2:
+            same_lane = self.lane[1:n] == self.lane[:n - 1]
+            leader[:-1] = np.where(same_lane, np.arange(1, n), -1)
+            gaps[:-1] = np.where(same_lane, x[1:] - x[:-1], np.inf)
+        if self.ring and n:
+            bounds = self.lane_bounds()
+            nonempty = bounds[1:] > bounds[:-1]
+            first = bounds[:-1][nonempty]
+            last = bounds[1:][nonempty] - 1
+            leader[last] = first
+            gaps[last] = x[first] + self.length - x[last]
+        return leader, gaps
+
+    def neighbors_in(self, target_lane):
+        # лидер и ведомый в заданной полосе для каждой машины
+        n = self.count
+        x = self.x[:n]
+        valid = (target_lane >= 0) & (target_lane < self.lanes)
+        target = np.clip(target_lane, 0, self.lanes - 1)
+        bounds = self.lane_bounds()
+        seg_start = bounds[target]
+        seg_end = bounds[target + 1]
+        pos = np.searchsorted(self.keys(), target * self.lane_span + x)
+
+        has_leader = valid & (pos < seg_end)
+        ahead = np.minimum(pos, n - 1)
+        lead_gap = np.where(has_leader, x[ahead] - x, np.inf)
+
+        has_follower = valid & (pos > seg_start)
+        behind = np.maximum(pos - 1, 0)
+        follow_gap = np.where(has_follower, x - x[behind], np.inf)
+
+        if self.ring:
+            nonempty = valid & (seg_end > seg_start)
+            first = np.minimum(seg_start, n - 1)
+            last = np.maximum(seg_end - 1, 0)
+
+            wrap = nonempty & ~has_leader
+            ahead = np.where(wrap, first, ahead)
+            lead_gap = np.where(wrap, x[first] + self.length - x, lead_gap)
+            has_leader |= wrap
+
+            wrap = nonempty & ~has_follower
+            behind = np.where(wrap, last, behind)
+            follow_gap = np.where(wrap, x + self.length - x[last], follow_gap)
+            has_follower |= wrap
+
+        leader = np.where(has_leader, ahead, -1)
+        follower = np.where(has_follower, behind, -1)
+        return leader, lead_gap, follower, follow_gap
+
+    def visible_ranges(self, x_min, x_max):
+        bounds = self.lane_bounds()
+        ranges = []
+        for lane in range(self.lanes):
+            start, end = bounds[lane], bounds[lane + 1]
+            x = self.x[start:end]
+            i0 = start + int(np.searchsorted(x, x_min))
+            i1 = start + int(np.searchsorted(x, x_max, side="right"))
+            ranges.append((lane, i0, i1))
+        return ranges
+
+    def visible_indices(self, x_min, x_max):
+        ranges = self.visible_ranges(x_min, x_max)
+        return np.concatenate([np.arange(i0, i1) for _, i0, i1 in ranges])
+
+    def set_lanes(self, lanes):
+        n = self.count
+        np.minimum(self.lane[:n], lanes - 1, out=self.lane[:n])
+        self.lanes = lanes
+        self.resort()
+
+    def find(self, car_id):
+        if car_id < 0:
+            return -1
+        slot = car_id & (len(self.id_keys) - 1)
+        if self.id_keys[slot] != car_id:
+            return -1
+        return int(self.id_rows[slot])
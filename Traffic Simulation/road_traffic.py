@@ -1,11 +1,47 @@
+import argparse
 import pygame
 import numpy as np
-import random
+import time
 from collections import deque
 
+from camera import Camera
+from engine import TrafficEngine
+from profiling import PhaseTimer
+from render_cache import RenderCache
+from road import STATUS_NAMES
+
+
+# подписи фаз шага движка в оверлее профилировки
+PHASE_LABELS = {
+    "commands": "команды",
+    "events": "события",
+    "spawn": "появление машин",
+    "lanes": "смена полос",
+    "physics": "физика",
+    "cleanup": "удаление машин",
+    "detectors": "детекторы",
+    "record": "запись",
+    "replay": "воспроизведение",
+    "publish": "публикация снимка",
+}
+
 
 class TrafficSimulation:
-    def __init__(self, width=1200, height=500):
+    # порядок отрисовки кадра; каждый вызов замеряется отдельно
+    draw_phases = (
+        "draw_road",
+        "draw_detectors",
+        "draw_distances",
+        "draw_cars",
+        "draw_statistics",
+        "draw_selected_car_info",
+        "draw_controls",
+        "draw_detector_panel",
+    )
+
+    def __init__(self, width=1200, height=500, road_length=None, lanes=1, initial_cars=0,
+                 ring=False, scenario=None, record=None, record_every=1, replay=None,
+                 detectors=None, detectors_csv=None, threaded=True, engine=None):
         pygame.init()
         self.screen = pygame.display.set_mode((width, height))
         pygame.display.set_caption("Трафик: Управляемое торможение")
@@ -13,31 +49,32 @@ class TrafficSimulation:
         self.width = width
         self.height = height
 
-        self.road_length = width - 100
+        if engine is None:
+            if road_length is None:
+                road_length = width - 100
+            engine = TrafficEngine(road_length, lanes, initial_cars, ring, scenario,
+                                   record, record_every, replay, detectors, detectors_csv)
+        self.engine = engine
+        # физика считается в отдельном потоке, окно рисует опубликованные снимки
+        self.threaded = threaded
+        self.snapshot = self.engine.front
+        road_length = self.engine.road.length
+
         self.road_y = height // 2
-        
-        self.spawn_rate = 0.6  
-        self.next_car_time = 0
-        self.cars = []  
-        self.next_car_id = 0
-
-        self.desired_distance = 80  
-        self.safe_distance = 60     
-        self.max_speed = 3.5      
-        self.min_speed = 0.1      
-        self.acceleration = 2.0   
-        self.braking_power = 4.0   
-
-        self.target_speed = 2.8    
-
-        self.selected_car_idx = -1
-        self.brake_duration = 180   
-
-        self.color_normal = (100, 200, 100)   
-        self.color_too_close = (255, 150, 50)  
-        self.color_braking = (255, 50, 50)     
-        self.color_far = (50, 150, 255)      
-        self.color_selected = (255, 255, 0)    
+        self.lane_width = 50
+
+        self.camera = Camera(50, width - 100, window_width=width)
+        self.camera.min_zoom = min(1.0, (width - 100) / road_length)
+        self.follow_selected = False
+
+        self.selected_car_id = -1
+
+        self.color_normal = (100, 200, 100)
+        self.color_too_close = (255, 150, 50)
+        self.color_braking = (255, 50, 50)
+        self.color_far = (50, 150, 255)
+        self.color_selected = (255, 255, 0)
+        self.state_colors = (self.color_normal, self.color_too_close, self.color_far)
 
         self.bg_color = (20, 25, 30)
         self.road_color = (40, 40, 45)
@@ -48,353 +85,468 @@ class TrafficSimulation:
 
         self.show_distances = True
 
-    def create_car(self):
-        speed = self.target_speed * random.uniform(0.8, 1.2)
-        speed = np.clip(speed, self.min_speed, self.max_speed)
-        
-        car_id = self.next_car_id
-        self.next_car_id += 1
-
-        start_x = -50 - random.randint(0, 100)
-        
-        self.cars.append([
-            start_x,       
-            speed,         
-            self.color_normal,  
-            False,         
-            0,              
-            car_id,         
-            "едет"        
-        ])
-        
-        self.next_car_time = random.expovariate(self.spawn_rate)
-
-    def update_car_physics(self, i):
-        x, v, color, is_braking, brake_timer, car_id, status = self.cars[i]
-
-        if is_braking and brake_timer > 0:
-            brake_timer -= 1
-            if brake_timer <= 0:
-                is_braking = False
-            v = max(self.min_speed, v * 0.7)
-            color = self.color_braking
-            status = "тормозит"
-
-        front_car = None
-        front_distance = float('inf')
-        
-        for j, (x2, v2, _, _, _, _, _) in enumerate(self.cars):
-            if j != i and x2 > x: 
-                distance = x2 - x
-                if distance < front_distance:
-                    front_distance = distance
-                    front_car = j
-
-        if front_car is not None:
-            x_front, v_front, _, _, _, _, _ = self.cars[front_car]
-            distance = x_front - x
-
-            if distance < self.safe_distance:
-                closeness = 1.0 - (distance / self.safe_distance)
-                dv = -self.braking_power * closeness
-                color = self.color_too_close
-                status = "тормозит"
-                
-            elif distance < self.desired_distance:
-                closeness = 1.0 - (distance / self.desired_distance)
-                dv = -self.acceleration * closeness
-                color = self.color_normal
-                status = "тормозит"
-                
-            elif distance > self.desired_distance * 1.2:
-                farness = (distance - self.desired_distance) / 100
-                dv = self.acceleration * min(1.0, farness)
-                color = self.color_far
-                status = "разгоняется"
-                
-            else:
+        self.render_cache = RenderCache()
+        # выше этого числа машин подписи id и скорости не рисуются
+        self.label_lod_threshold = 150
+        # выше этого числа видимых машин дорога рисуется как полоса плотности
+        self.car_draw_limit = 3000
+        self.frame_times = deque(maxlen=60)
+        self.timer = PhaseTimer()
+        self.show_profile = False
+        self.frame_budget = 1 / 60
 
-                dv = 0
-                color = self.color_normal
-                status = "едет"
+    @property
+    def road(self):
+        return self.snapshot.road
 
-            if v > v_front:
-                dv -= self.acceleration * 0.3
-                status = "тормозит"
-            
-        else:
-            if v < self.target_speed:
-                dv = self.acceleration * 0.5
-                status = "разгоняется"
-            else:
-                dv = -self.acceleration * 0.2
-                status = "тормозит"
-            color = self.color_normal
+    @property
+    def params(self):
+        return self.snapshot.params
 
-        v += dv * 0.05
+    def set_lanes(self, lanes):
+        self.engine.send("set_lanes", lanes)
+        self.render_cache.scratch.clear()
 
-        v = np.clip(v, self.min_speed, self.max_speed)
+    def reset(self):
+        self.engine.send("reset")
+        self.selected_car_id = -1
 
-        x += v
+    def lane_y(self, lane):
+        return self.road_y + ((self.road.lanes - 1) / 2 - lane) * self.lane_width
 
-        if i == self.selected_car_idx:
-            color = self.color_selected
-        
-        self.cars[i] = [x, v, color, is_braking, brake_timer, car_id, status]
+    def selected_index(self):
+        if self.selected_car_id < 0:
+            return -1
+        return self.road.find(self.selected_car_id)
 
     def brake_selected_car(self):
-        if 0 <= self.selected_car_idx < len(self.cars):
-            x, v, _, _, _, car_id, _ = self.cars[self.selected_car_idx]
+        if self.selected_index() >= 0:
+            self.engine.send("on_brake", self.selected_car_id, self.params["brake_duration"])
 
-            self.cars[self.selected_car_idx][3] = True 
-            self.cars[self.selected_car_idx][4] = self.brake_duration
-            
-            print(f"Машина #{car_id} тормозит на {self.brake_duration/60:.1f} сек!")
-
-            self.selected_car_idx = -1
+            self.selected_car_id = -1
 
     def select_next_car(self):
-        if not self.cars:
-            self.selected_car_idx = -1
+        visible = self.road.visible_indices(*self.camera.visible())
+        if len(visible) == 0:
+            self.selected_car_id = -1
             return
-            
-        if self.selected_car_idx == -1:
-            self.selected_car_idx = 0
-        else:
-            self.selected_car_idx = (self.selected_car_idx + 1) % len(self.cars)
-
-        x, v, _, is_braking, brake_timer, car_id, status = self.cars[self.selected_car_idx]
-        print(f"Выбрана машина #{car_id}, скорость: {v:.2f}, статус: {status}")
 
-    def remove_offroad_cars(self):
-        self.cars = [car for car in self.cars if car[0] < self.road_length + 200]
+        pos = np.flatnonzero(visible == self.selected_index())
+        if len(pos) and pos[0] + 1 < len(visible):
+            idx = visible[pos[0] + 1]
+        else:
+            idx = visible[0]
+        self.select_car(idx)
+
+    def select_car(self, idx):
+        road = self.road
+        car_id = int(road.ids[idx])
+        self.selected_car_id = car_id
+        status = STATUS_NAMES[road.status[idx]]
+        print(f"Выбрана машина #{car_id}, скорость: {road.v[idx]:.2f}, статус: {status}")
+
+    def update_camera(self):
+        if self.follow_selected:
+            idx = self.selected_index()
+            if idx >= 0:
+                self.camera.center_on(self.road.x[idx])
+        self.camera.clamp(0, self.road.length)
 
     def draw_road(self):
         self.screen.fill(self.bg_color)
 
-        pygame.draw.rect(self.screen, self.road_color, 
-                        (50, self.road_y - 25, self.road_length, 50))
+        cam = self.camera
+        road_start = max(0, int(cam.to_screen(0)))
+        road_end = min(self.width, int(cam.to_screen(self.road.length)))
+        half = self.road.lanes * self.lane_width // 2
+        top = self.road_y - half
+        bottom = self.road_y + half
+
+        pygame.draw.rect(self.screen, self.road_color,
+                        (road_start, top, road_end - road_start, 2 * half))
+
+        if self.road.lanes == 1:
+            marking_ys = [self.road_y]
+        else:
+            marking_ys = [top + k * self.lane_width for k in range(1, self.road.lanes)]
 
         dash_len = 25
         gap_len = 20
-        for x in range(60, self.width - 40, dash_len + gap_len):
-            pygame.draw.line(self.screen, self.marking_color,
-                           (x, self.road_y), 
-                           (x + dash_len, self.road_y), 4)
+        period = dash_len + gap_len
+        # при сильном отдалении разметка сливается, её не рисуем
+        if period * cam.zoom >= 6:
+            x_min, x_max = cam.visible()
+            first = max(0, int((x_min - 10) // period))
+            last = int((min(x_max, self.road.length - 30) - 10) // period)
+            for k in range(first, last + 1):
+                x = cam.to_screen(10 + k * period)
+                for y in marking_ys:
+                    pygame.draw.line(self.screen, self.marking_color,
+                                   (x, y), (x + dash_len * cam.zoom, y), 4)
 
         pygame.draw.line(self.screen, (255, 255, 255),
-                        (50, self.road_y - 25), 
-                        (self.width - 50, self.road_y - 25), 3)
+                        (road_start, top), (road_end, top), 3)
         pygame.draw.line(self.screen, (255, 255, 255),
-                        (50, self.road_y + 25), 
-                        (self.width - 50, self.road_y + 25), 3)
+                        (road_start, bottom), (road_end, bottom), 3)
+
+    def draw_detectors(self):
+        detectors = self.snapshot.detectors
+        if not detectors:
+            return
+
+        half = self.road.lanes * self.lane_width // 2
+        x_min, x_max = self.camera.visible()
+        for k, position in enumerate(detectors["positions"].tolist()):
+            if not x_min <= position <= x_max:
+                continue
+            x = int(self.camera.to_screen(position))
+            pygame.draw.line(self.screen, (80, 220, 255),
+                           (x, self.road_y - half - 6), (x, self.road_y + half + 6), 2)
+            label = self.render_cache.label(self.small_font, f"Д{k + 1}", (80, 220, 255))
+            self.screen.blit(label, label.get_rect(center=(x, self.road_y + half + 16)))
+
+    def draw_detector_panel(self):
+        values = self.snapshot.detectors
+        if not values:
+            return
+
+        shown = min(len(values["positions"]), 6)
+        panel_width = 420
+        panel_height = 45 + shown * 20
+        panel_x = self.width - panel_width - 10
+        panel_y = self.height - panel_height - 10
+
+        def build(surf):
+            pygame.draw.rect(surf, (0, 0, 0, 180),
+                            (0, 0, panel_width, panel_height), border_radius=8)
+            title = self.font.render("ДЕТЕКТОРЫ", True, (80, 220, 255))
+            surf.blit(title, (20, 12))
+
+        panel = self.render_cache.panel("detectors", (panel_width, panel_height), build)
+        self.screen.blit(panel, (panel_x, panel_y))
+
+        for k in range(shown):
+            speed = values["speed"][k]
+            line = (f"Д{k + 1}: {values['flow'][k]:.0f} авт/ч, "
+                    f"{values['density'][k]:.1f} авт/1000, "
+                    f"{values['occupancy'][k]:.0f}%, "
+                    f"v={'-' if np.isnan(speed) else f'{speed:.2f}'}")
+            text = self.render_cache.label(self.small_font, line, (220, 220, 220))
+            self.screen.blit(text, (panel_x + 20, panel_y + 40 + k * 20))
 
     def draw_cars(self):
-        for i, (x, v, color, is_braking, brake_timer, car_id, status) in enumerate(self.cars):
-            pos_x = int(x) + 50
-            pos_y = self.road_y
+        road = self.road
+        visible = road.visible_indices(*self.camera.visible(margin=20))
+        if len(visible) > self.car_draw_limit:
+            self.draw_density()
+            return
+
+        show_labels = len(visible) <= self.label_lod_threshold
+        label = self.render_cache.label
+        screen_x = self.camera.to_screen(road.x[visible]).astype(int).tolist()
+        screen_y = self.lane_y(road.lane[visible]).astype(int).tolist()
+        speeds = road.v[visible].tolist()
+        states = road.state[visible].tolist()
+        braking = road.braking[visible].tolist()
+        remaining = (road.brake_until[visible] - self.snapshot.sim_time).tolist()
+        ids = road.ids[visible].tolist()
+        flash = pygame.time.get_ticks() % 500 < 250
+
+        for pos_x, pos_y, v, state, is_braking, brake_left, car_id in zip(
+                screen_x, screen_y, speeds, states, braking, remaining, ids):
 
             radius = int(10 + v * 1.5)
 
+            color = self.state_colors[state]
+            if car_id == self.selected_car_id:
+                color = self.color_selected
+
             pygame.draw.circle(self.screen, color, (pos_x, pos_y), radius)
-            
+
             border_color = (255, 255, 255)
             if is_braking:
-                border_color = (255, 100, 100) 
-                if pygame.time.get_ticks() % 500 < 250:
-                    pygame.draw.circle(self.screen, (255, 200, 200), 
+                border_color = (255, 100, 100)
+                if flash:
+                    pygame.draw.circle(self.screen, (255, 200, 200),
                                      (pos_x, pos_y), radius + 3, 2)
-            
+
             pygame.draw.circle(self.screen, border_color, (pos_x, pos_y), radius, 2)
-            
-            id_text = self.small_font.render(str(car_id), True, (255, 255, 255))
-            id_rect = id_text.get_rect(center=(pos_x, pos_y))
-            self.screen.blit(id_text, id_rect)
-            
-            speed_text = self.small_font.render(f"{v:.1f}", True, (255, 255, 255))
-            speed_rect = speed_text.get_rect(center=(pos_x, pos_y - radius - 10))
-            self.screen.blit(speed_text, speed_rect)
-            
-            if is_braking and brake_timer > 0:
+
+            if show_labels:
+                id_text = label(self.small_font, str(car_id), (255, 255, 255))
+                id_rect = id_text.get_rect(center=(pos_x, pos_y))
+                self.screen.blit(id_text, id_rect)
+
+                speed_text = label(self.small_font, f"{v:.1f}", (255, 255, 255))
+                speed_rect = speed_text.get_rect(center=(pos_x, pos_y - radius - 10))
+                self.screen.blit(speed_text, speed_rect)
+
+            if is_braking and brake_left > 0:
                 bar_width = 30
                 bar_height = 4
-                progress = brake_timer / self.brake_duration
-                
+                progress = min(1.0, brake_left / self.params["brake_duration"])
+
                 pygame.draw.rect(self.screen, (200, 200, 200),
-                               (pos_x - bar_width//2, pos_y + radius + 5, 
+                               (pos_x - bar_width//2, pos_y + radius + 5,
                                 bar_width, bar_height), 1)
                 pygame.draw.rect(self.screen, (255, 100, 100),
-                               (pos_x - bar_width//2, pos_y + radius + 5, 
+                               (pos_x - bar_width//2, pos_y + radius + 5,
                                 int(bar_width * progress), bar_height))
 
+    def draw_density(self):
+        road = self.road
+        for lane, i0, i1 in road.visible_ranges(*self.camera.visible()):
+            self.draw_lane_density(lane, i0, i1)
+
+    def draw_lane_density(self, lane, i0, i1):
+        road = self.road
+        columns = self.camera.to_screen(road.x[i0:i1]).astype(int)
+        inside = (columns >= 0) & (columns < self.width)
+        columns = columns[inside]
+        counts = np.bincount(columns, minlength=self.width)
+        speed_sum = np.bincount(columns, weights=road.v[i0:i1][inside], minlength=self.width)
+
+        occupied = counts > 0
+        mean_speed = np.zeros(self.width)
+        mean_speed[occupied] = speed_sum[occupied] / counts[occupied]
+        t = np.clip(mean_speed / self.params["max_speed"], 0, 1)
+
+        rgb = np.empty((self.width, 1, 3), dtype=np.uint8)
+        rgb[:, 0, 0] = np.where(occupied, 255 * (1 - t), self.road_color[0])
+        rgb[:, 0, 1] = np.where(occupied, 60 + 160 * t, self.road_color[1])
+        rgb[:, 0, 2] = np.where(occupied, 60, self.road_color[2])
+
+        strip_height = self.lane_width - 20
+        strip = pygame.transform.scale(pygame.surfarray.make_surface(rgb),
+                                       (self.width, strip_height))
+        self.screen.blit(strip, (0, int(self.lane_y(lane)) - strip_height // 2))
+
     def draw_distances(self):
-        if not self.show_distances or len(self.cars) < 2:
+        road = self.road
+        if not self.show_distances or road.count < 2:
             return
 
-        sorted_cars = sorted(enumerate(self.cars), key=lambda item: item[1][0])
-        
-        for idx in range(len(sorted_cars) - 1):
-            i, (x1, v1, _, _, _, id1, _) = sorted_cars[idx]
-            j, (x2, v2, _, _, _, id2, _) = sorted_cars[idx + 1]
-            
-            distance = x2 - x1
-            pos_x1 = int(x1) + 50
-            pos_x2 = int(x2) + 50
-            pos_y = self.road_y
-
-            if distance < self.safe_distance:
-                line_color = (255, 50, 50, 180) 
+        ranges = road.visible_ranges(*self.camera.visible())
+        if sum(i1 - i0 for _, i0, i1 in ranges) > self.car_draw_limit:
+            return
+
+        bounds = road.lane_bounds()
+        top = int(self.lane_y(road.lanes - 1)) - 2
+        height = (road.lanes - 1) * self.lane_width + 4
+        line_surf = self.render_cache.scratch_surface("distances", (self.width, height))
+        for lane, i0, i1 in ranges:
+            # соседи за краем экрана тоже нужны, чтобы линии доходили до края
+            i0 = max(bounds[lane], i0 - 1)
+            i1 = min(bounds[lane + 1], i1 + 1)
+            y = int(self.lane_y(lane)) - top
+            self.draw_lane_distances(line_surf, road.x[i0:i1], y)
+
+        self.screen.blit(line_surf, (0, top))
+
+    def draw_lane_distances(self, line_surf, positions, y):
+        safe_distance = self.params["safe_distance"]
+        desired_distance = self.params["desired_distance"]
+        screen_x = self.camera.to_screen(positions).astype(int).tolist()
+        distances = np.diff(positions).tolist()
+
+        for idx, distance in enumerate(distances):
+            pos_x1 = screen_x[idx]
+            pos_x2 = screen_x[idx + 1]
+
+            if distance < safe_distance:
+                line_color = (255, 50, 50, 180)
                 line_width = 3
-            elif distance < self.desired_distance:
-                line_color = (255, 200, 50, 150) 
+            elif distance < desired_distance:
+                line_color = (255, 200, 50, 150)
                 line_width = 2
             else:
-                line_color = (50, 200, 50, 120) 
+                line_color = (50, 200, 50, 120)
                 line_width = 1
-            
-            line_surf = pygame.Surface((abs(pos_x2 - pos_x1), 4), pygame.SRCALPHA)
-            pygame.draw.line(line_surf, line_color, 
-                           (0, 2), (abs(pos_x2 - pos_x1), 2), line_width)
-            self.screen.blit(line_surf, (min(pos_x1, pos_x2), pos_y - 2))
+
+            pygame.draw.line(line_surf, line_color,
+                           (pos_x1, y), (pos_x2, y), line_width)
 
     def draw_statistics(self):
         stat_width = 320
-        stat_height = 180
+        stat_height = 200
         stat_x = 20
         stat_y = 20
-        
-        pygame.draw.rect(self.screen, (0, 0, 0, 200), 
-                        (stat_x, stat_y, stat_width, stat_height), border_radius=8)
-        
-        title = self.font.render("СТАТИСТИКА", True, (255, 200, 100))
-        self.screen.blit(title, (stat_x + 20, stat_y + 15))
-        
-        num_cars = len(self.cars)
+
+        def build(surf):
+            pygame.draw.rect(surf, (0, 0, 0, 200),
+                            (0, 0, stat_width, stat_height), border_radius=8)
+            title = self.font.render("СТАТИСТИКА", True, (255, 200, 100))
+            surf.blit(title, (20, 15))
+
+        panel = self.render_cache.panel("statistics", (stat_width, stat_height), build)
+        self.screen.blit(panel, (stat_x, stat_y))
+
+        num_cars = self.road.count
         if num_cars > 0:
-            speeds = [car[1] for car in self.cars]
-            avg_speed = np.mean(speeds)
-            min_speed = min(speeds)
-            max_speed = max(speeds)
-            
-            if num_cars > 1:
-                positions = [car[0] for car in self.cars]
-                positions.sort()
-                min_distance = min(positions[i+1] - positions[i] 
-                                 for i in range(len(positions)-1))
-            else:
-                min_distance = float('inf')
+            avg_speed = self.road.v[:num_cars].mean()
+        else:
+            avg_speed = 0
+
+        if self.frame_times:
+            frame_ms = sum(self.frame_times) / len(self.frame_times) * 1000
         else:
-            avg_speed = min_speed = max_speed = 0
-            min_distance = 0
-        
+            frame_ms = 0
+
+        params = self.params
         stats = [
             f"Машин на дороге: {num_cars}",
             f"Средняя скорость: {avg_speed:.2f}",
-            f"Желаемая дистанция: {self.desired_distance}",
-            f"Безопасная дистанция: {self.safe_distance}",
-            f"Целевая скорость: {self.target_speed:.1f}",
-            f"Интенсивность: {self.spawn_rate:.1f}"
+            f"Желаемая дистанция: {params['desired_distance']}",
+            f"Безопасная дистанция: {params['safe_distance']}",
+            f"Целевая скорость: {params['target_speed']:.1f}",
+            (f"Плотность: {num_cars / self.road.length * 1000:.1f} на 1000"
+             if params["ring"] else f"Интенсивность: {params['spawn_rate']:.1f}"),
+            f"Время кадра: {frame_ms:.1f} мс"
         ]
-        
+        replay = self.snapshot.replay
+        if replay:
+            stats.append(f"Запись: {replay['time']:.1f} / {replay['end']:.1f} с, "
+                         f"x{replay['speed']:g}"
+                         + (" (пауза)" if replay["paused"] else ""))
+
         for i, stat in enumerate(stats):
-            stat_text = self.small_font.render(stat, True, (220, 220, 220))
+            stat_text = self.render_cache.label(self.small_font, stat, (220, 220, 220))
             self.screen.blit(stat_text, (stat_x + 20, stat_y + 45 + i * 20))
 
     def draw_selected_car_info(self):
-        if self.selected_car_idx < 0 or self.selected_car_idx >= len(self.cars):
+        idx = self.selected_index()
+        if idx < 0:
             return
-        
-        x, v, _, is_braking, brake_timer, car_id, status = self.cars[self.selected_car_idx]
-        
+
+        road = self.road
+        x = road.x[idx]
+        v = road.v[idx]
+        is_braking = road.braking[idx]
+        brake_left = road.brake_until[idx] - self.snapshot.sim_time
+        car_id = road.ids[idx]
+        lane = road.lane[idx]
+        status = STATUS_NAMES[road.status[idx]]
+
         info_width = 280
         info_height = 200
         info_x = 20
         info_y = self.height - info_height - 20
-        
-        pygame.draw.rect(self.screen, (0, 0, 0, 180), 
+
+        pygame.draw.rect(self.screen, (0, 0, 0, 180),
                         (info_x, info_y, info_width, info_height), border_radius=8)
-        
+
 
         title = self.font.render("ВЫБРАННАЯ МАШИНА", True, (255, 255, 100))
         self.screen.blit(title, (info_x + 20, info_y + 15))
-        
+
         if status == "разгоняется":
-            status_color = (100, 255, 100) 
+            status_color = (100, 255, 100)
         elif status == "тормозит":
-            status_color = (255, 100, 100) 
-        else:  
-            status_color = (100, 200, 255)  
-        
+            status_color = (255, 100, 100)
+        else:
+            status_color = (100, 200, 255)
+
         info_lines = [
             f"ID машины: {car_id}",
             f"Скорость: {v:.2f}",
             f"Позиция: {x:.1f}",
-            f"Статус: {status}"
+            f"Статус: {status}",
+            f"Полоса: {lane + 1}"
         ]
-        
+
         for i, line in enumerate(info_lines):
             color = (220, 220, 220)
-            if i == 3:  
+            if i == 3:
                 color = status_color
-            
+
             line_text = self.small_font.render(line, True, color)
             self.screen.blit(line_text, (info_x + 20, info_y + 50 + i * 22))
-        
-        if is_braking and brake_timer > 0:
-            remaining_time = brake_timer / 60 
-            timer_text = self.small_font.render(f"Торможение: {remaining_time:.1f} сек", 
+
+        if is_braking and brake_left > 0:
+            timer_text = self.small_font.render(f"Торможение: {brake_left:.1f} сек",
                                               True, (255, 150, 150))
             self.screen.blit(timer_text, (info_x + 20, info_y + info_height - 30))
-            
+
             bar_width = 240
             bar_height = 6
             bar_x = info_x + 20
             bar_y = info_y + info_height - 15
-            
-            progress = brake_timer / self.brake_duration
-            pygame.draw.rect(self.screen, (100, 100, 100), 
+
+            progress = min(1.0, brake_left / self.params["brake_duration"])
+            pygame.draw.rect(self.screen, (100, 100, 100),
                            (bar_x, bar_y, bar_width, bar_height), border_radius=3)
-            pygame.draw.rect(self.screen, (255, 100, 100), 
-                           (bar_x, bar_y, int(bar_width * (1 - progress)), bar_height), 
+            pygame.draw.rect(self.screen, (255, 100, 100),
+                           (bar_x, bar_y, int(bar_width * (1 - progress)), bar_height),
                            border_radius=3)
 
     def draw_controls(self):
         ctrl_width = 400
-        ctrl_height = 220
+        ctrl_height = 314
         ctrl_x = self.width - ctrl_width - 10
         ctrl_y = 0
-        
-        pygame.draw.rect(self.screen, (0, 0, 0, 100), 
-                        (ctrl_x, ctrl_y, ctrl_width, ctrl_height), border_radius=8)
-        
+
+        panel = self.render_cache.panel("controls", (ctrl_width, ctrl_height),
+                                        self.build_controls_panel)
+        self.screen.blit(panel, (ctrl_x, ctrl_y))
+
+    def build_controls_panel(self, surf):
+        ctrl_width, ctrl_height = surf.get_size()
+
+        pygame.draw.rect(surf, (0, 0, 0, 100),
+                        (0, 0, ctrl_width, ctrl_height), border_radius=8)
+
         title = self.font.render("УПРАВЛЕНИЕ", True, (100, 255, 100))
-        self.screen.blit(title, (ctrl_x + 20, ctrl_y + 15))
-        
-        controls = [
+        surf.blit(title, (20, 15))
+
+        for i, (key, desc) in enumerate(self.controls()):
+            y = 45 + i * 22
+
+            # Ключ
+            key_text = self.small_font.render(key, True, (100, 255, 100))
+            surf.blit(key_text, (20, y))
+
+            # Описание
+            desc_text = self.small_font.render(desc, True, (220, 220, 220))
+            surf.blit(desc_text, (140, y))
+
+    def controls(self):
+        if self.engine.replay:
+            return [
+                ("TAB", "Выбрать машину"),
+                ("SPACE", "Пауза"),
+                ("D", "Показать/скрыть дистанции"),
+                ("R", "С начала записи"),
+                ("ВЛЕВО/ВПРАВО", "Перемотка на 5 сек"),
+                ("ВВЕРХ/ВНИЗ", "Скорость воспроизведения"),
+                ("Q/E", "Прокрутка дороги"),
+                ("КОЛЕСО МЫШИ", "Масштаб"),
+                ("F", "Следовать за выбранной"),
+                ("P", "Профилировка кадра")
+            ]
+        return [
             ("TAB", "Выбрать машину"),
             ("SPACE", "Тормозить выбранную"),
             ("D", "Показать/скрыть дистанции"),
             ("R", "Сбросить симуляцию"),
             ("ВВЕРХ/ВНИЗ", "Интенсивность трафика"),
             ("ВЛЕВО/ВПРАВО", "Целевая скорость"),
-            ("ПЛЮС/МИНУС", "Желаемая дистанция")
+            ("ПЛЮС/МИНУС", "Желаемая дистанция"),
+            ("Q/E", "Прокрутка дороги"),
+            ("КОЛЕСО МЫШИ", "Масштаб"),
+            ("F", "Следовать за выбранной"),
+            ("L", "Число полос"),
+            ("P", "Профилировка кадра")
         ]
-        
-        for i, (key, desc) in enumerate(controls):
-            y = ctrl_y + 45 + i * 25
-            
-            # Ключ
-            key_text = self.small_font.render(key, True, (100, 255, 100))
-            self.screen.blit(key_text, (ctrl_x + 20, y))
-            
-            # Описание
-            desc_text = self.small_font.render(desc, True, (220, 220, 220))
-            self.screen.blit(desc_text, (ctrl_x + 140, y))
 
     def handle_events(self):
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 return False
+            elif event.type == pygame.MOUSEWHEEL:
+                factor = 1.25 if event.y > 0 else 0.8
+                self.camera.zoom_at(factor, pygame.mouse.get_pos()[0])
+            elif event.type == pygame.KEYDOWN and self.engine.replay:
+                self.handle_replay_key(event.key)
             elif event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_TAB:
                     self.select_next_car()
@@ -403,58 +555,175 @@ class TrafficSimulation:
                 elif event.key == pygame.K_d:
                     self.show_distances = not self.show_distances
                 elif event.key == pygame.K_r:
-                    self.cars = []
-                    self.selected_car_idx = -1
+                    self.reset()
                 elif event.key == pygame.K_UP:
-                    self.spawn_rate = min(2.0, self.spawn_rate + 0.1)
+                    self.engine.send("adjust", "spawn_rate", 0.1, 0.1, 2.0)
                 elif event.key == pygame.K_DOWN:
-                    self.spawn_rate = max(0.1, self.spawn_rate - 0.1)
+                    self.engine.send("adjust", "spawn_rate", -0.1, 0.1, 2.0)
                 elif event.key == pygame.K_RIGHT:
-                    self.target_speed = min(5.0, self.target_speed + 0.2)
+                    self.engine.send("adjust", "target_speed", 0.2, 1.0, 5.0)
                 elif event.key == pygame.K_LEFT:
-                    self.target_speed = max(1.0, self.target_speed - 0.2)
+                    self.engine.send("adjust", "target_speed", -0.2, 1.0, 5.0)
                 elif event.key == pygame.K_PLUS or event.key == pygame.K_EQUALS:
-                    self.desired_distance = min(150, self.desired_distance + 5)
-                    self.safe_distance = min(120, self.safe_distance + 4)
+                    self.engine.send("adjust", "desired_distance", 5, 40, 150)
+                    self.engine.send("adjust", "safe_distance", 4, 30, 120)
                 elif event.key == pygame.K_MINUS:
-                    self.desired_distance = max(40, self.desired_distance - 5)
-                    self.safe_distance = max(30, self.safe_distance - 4)
-        
+                    self.engine.send("adjust", "desired_distance", -5, 40, 150)
+                    self.engine.send("adjust", "safe_distance", -4, 30, 120)
+                elif event.key == pygame.K_f:
+                    self.follow_selected = not self.follow_selected
+                elif event.key == pygame.K_l:
+                    self.set_lanes(self.road.lanes % 6 + 1)
+                elif event.key == pygame.K_p:
+                    self.show_profile = not self.show_profile
+
+        # прокрутка работает, пока клавиша зажата
+        keys = pygame.key.get_pressed()
+        if keys[pygame.K_q]:
+            self.camera.scroll(-20)
+            self.follow_selected = False
+        if keys[pygame.K_e]:
+            self.camera.scroll(20)
+            self.follow_selected = False
+
         return True
 
+    def handle_replay_key(self, key):
+        if key == pygame.K_TAB:
+            self.select_next_car()
+        elif key == pygame.K_SPACE:
+            self.engine.send("toggle_replay_pause")
+        elif key == pygame.K_d:
+            self.show_distances = not self.show_distances
+        elif key == pygame.K_r:
+            self.reset()
+        elif key == pygame.K_RIGHT:
+            self.engine.send("seek_replay_by", 5)
+        elif key == pygame.K_LEFT:
+            self.engine.send("seek_replay_by", -5)
+        elif key == pygame.K_UP:
+            self.engine.send("scale_replay_speed", 2)
+        elif key == pygame.K_DOWN:
+            self.engine.send("scale_replay_speed", 0.5)
+        elif key == pygame.K_f:
+            self.follow_selected = not self.follow_selected
+        elif key == pygame.K_p:
+            self.show_profile = not self.show_profile
+
+    def draw_profile(self):
+        rows = [("ДВИЖОК (шаг)", None)]
+        engine_times = self.snapshot.timings
+        for name, seconds in engine_times.items():
+            rows.append((PHASE_LABELS.get(name, name), seconds))
+        rows.append(("всего", sum(engine_times.values())))
+        rows.append(("ОТРИСОВКА (кадр)", None))
+        view_times = self.timer.means()
+        rows.extend(view_times.items())
+        rows.append(("всего", sum(view_times.values())))
+
+        panel_width = 360
+        panel_height = 20 + len(rows) * 18
+        panel_x = 360
+        panel_y = 20
+
+        def build(surf):
+            pygame.draw.rect(surf, (0, 0, 0, 210),
+                            (0, 0, panel_width, panel_height), border_radius=8)
+
+        panel = self.render_cache.panel(("profile", panel_height),
+                                        (panel_width, panel_height), build)
+        self.screen.blit(panel, (panel_x, panel_y))
+
+        # полоса показывает долю бюджета кадра в 1/60 сек
+        bar_x = panel_x + 250
+        bar_width = 90
+        for i, (name, seconds) in enumerate(rows):
+            y = panel_y + 10 + i * 18
+            if seconds is None:
+                title = self.render_cache.label(self.small_font, name, (255, 200, 100))
+                self.screen.blit(title, (panel_x + 15, y))
+                continue
+
+            label = self.render_cache.label(self.small_font, name, (220, 220, 220))
+            self.screen.blit(label, (panel_x + 25, y))
+            ms = self.render_cache.label(self.small_font, f"{seconds * 1000:.2f} мс",
+                                         (220, 220, 220))
+            self.screen.blit(ms, (bar_x - 10 - ms.get_width(), y))
+
+            share = seconds / self.frame_budget
+            if share > 0.5:
+                color = (255, 80, 80)
+            elif share > 0.2:
+                color = (255, 180, 60)
+            else:
+                color = (100, 220, 100)
+            pygame.draw.rect(self.screen, (60, 60, 70), (bar_x, y + 3, bar_width, 8))
+            pygame.draw.rect(self.screen, color,
+                           (bar_x, y + 3, int(bar_width * min(share, 1.0)), 8))
+
+    def draw_frame(self):
+        for name in self.draw_phases:
+            with self.timer.phase(name):
+                getattr(self, name)()
+        if self.show_profile:
+            with self.timer.phase("draw_profile"):
+                self.draw_profile()
+        self.timer.commit()
+
     def run(self):
         running = True
-        last_time = pygame.time.get_ticks() / 1000.0
-        
-        while running:
-            current_time = pygame.time.get_ticks() / 1000.0
-            dt = current_time - last_time
-            last_time = current_time
-            
-            running = self.handle_events()
-            
-            self.next_car_time -= dt
-            if self.next_car_time <= 0:
-                self.create_car()
-            
-            for i in range(len(self.cars)):
-                self.update_car_physics(i)
-            
-            self.remove_offroad_cars()
-
-            self.draw_road()
-            self.draw_distances()
-            self.draw_cars()
-            self.draw_statistics() 
-            self.draw_selected_car_info()  
-            self.draw_controls()          
-
-            pygame.display.flip()
-            self.clock.tick(60)
-        
-        pygame.quit()
+        if self.threaded:
+            self.engine.start()
+
+        # запись и CSV детекторов закрываются и при исключении, и по Ctrl+C
+        try:
+            while running:
+                frame_start = time.perf_counter()
+                if self.threaded:
+                    self.engine.check()
+                else:
+                    self.engine.step()
+                    self.engine.publish(wait=True)
+
+                # пока кадр рисуется, движок не может подменить снимок
+                with self.engine.frame() as snapshot:
+                    self.snapshot = snapshot
+                    running = self.handle_events()
+                    self.update_camera()
+                    self.draw_frame()
+
+                self.frame_times.append(time.perf_counter() - frame_start)
+                pygame.display.flip()
+                self.clock.tick(60)
+        finally:
+            self.engine.close()
+            pygame.quit()
 
 
 if __name__ == "__main__":
-    sim = TrafficSimulation(width=1200, height=500)
+    parser = argparse.ArgumentParser(description="Симуляция дорожного трафика")
+    parser.add_argument("--length", type=float, default=None, help="длина дороги")
+    parser.add_argument("--lanes", type=int, default=1, choices=range(1, 7), help="число полос")
+    parser.add_argument("--cars", type=int, default=0, help="машин на дороге в начале")
+    parser.add_argument("--ring", action="store_true", help="кольцевая дорога")
+    parser.add_argument("--scenario", default=None, help="JSON-файл со сценарием событий")
+    parser.add_argument("--record", default=None, help="записать траектории в файл (без расширения)")
+    parser.add_argument("--record-every", type=int, default=1, help="записывать каждый N-й шаг")
+    parser.add_argument("--replay", default=None, help="воспроизвести запись вместо симуляции")
+    parser.add_argument("--detectors", default=None,
+                        help="позиции детекторов через запятую, пустая строка - без детекторов")
+    parser.add_argument("--detectors-csv", default=None, help="писать показания детекторов в CSV")
+    parser.add_argument("--single-thread", action="store_true",
+                        help="считать физику в потоке отрисовки")
+    args = parser.parse_args()
+
+    detectors = None
+    if args.detectors is not None:
+        detectors = [float(x) for x in args.detectors.split(",") if x.strip()]
+
+    sim = TrafficSimulation(width=1200, height=500, road_length=args.length, lanes=args.lanes,
+                            initial_cars=args.cars, ring=args.ring, scenario=args.scenario,
+                            record=args.record, record_every=args.record_every,
+                            replay=args.replay, detectors=detectors,
+                            detectors_csv=args.detectors_csv, threaded=not args.single_thread)
     sim.run()